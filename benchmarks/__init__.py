@@ -0,0 +1,7 @@
+"""
+MonARK benchmarks.
+
+Run with "python -m benchmarks" from the repository root.
+Inputs are synthesised (see synth.py) and are deterministic for a given seed,
+so results from different runs can be compared against a saved JSON baseline.
+"""
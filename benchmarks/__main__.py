@@ -0,0 +1,239 @@
+"""
+Runs the benchmarks, and optionally saves/compares JSON baselines.
+
+    python -m benchmarks [-o results.json] [-c baseline.json] [-k pattern]
+
+Each benchmark runs in its own forked process, so the peak RSS reported is
+(mostly) its own.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import importlib.util
+import multiprocessing
+
+from os.path import join, dirname, abspath
+
+from monark import mod
+from monark import modtool
+from monark import uassetz
+
+from . import synth
+
+
+MB = 1024 * 1024
+
+
+def load_merge():
+    path = join(dirname(dirname(abspath(__file__))), "tools", "merge.py")
+    spec = importlib.util.spec_from_file_location("merge", path)
+    merge = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(merge)
+    return merge
+
+
+# Benchmarks #################################################################
+# Each takes (params, workdir), and returns a dict with at least "seconds",
+# and "bytes" and/or "files" for throughput.
+
+def bench_compress(params, workdir):
+    data = synth.gen_data(params.size, params.compressibility)
+    start = time.perf_counter()
+    uassetz.compress(io.BytesIO(data), io.BytesIO(), workers=params.workers)
+    return {"seconds": time.perf_counter() - start, "bytes": len(data)}
+
+
+def bench_decompress(params, workdir):
+    path = join(workdir, "bench.uasset.z")
+    size = synth.gen_uassetz(path, params.size, params.compressibility)
+    start = time.perf_counter()
+    with open(path, "rb") as src:
+        uassetz.decompress(src, io.BytesIO(), workers=params.workers)
+    return {"seconds": time.perf_counter() - start, "bytes": size}
+
+
+def bench_decompress_file(params, workdir):
+    path = join(workdir, "bench.uasset.z")
+    size = synth.gen_uassetz(path, params.size, params.compressibility)
+    start = time.perf_counter()
+    uassetz.decompress_file(path, join(workdir, "bench.uasset"), params.workers)
+    return {"seconds": time.perf_counter() - start, "bytes": size}
+
+
+def _ark_root(params, workdir):
+    root = join(workdir, "ark")
+    modids = synth.gen_ark_root(
+        root, params.mods, params.files, params.file_size, params.compressibility
+    )
+    os.chdir(root)
+    return modids
+
+
+def bench_mod_install(params, workdir):
+    modids = _ark_root(params, workdir)
+    storage = modtool.DEFAULT_MOD_STORAGE_DIR
+    start = time.perf_counter()
+    for modid in modids:
+        modtool.do_mod_install(
+            modid, storage, "WindowsNoEditor", params.workers, log=lambda _: None
+        )
+    seconds = time.perf_counter() - start
+
+    size = files = 0
+    for dirpath, dirnames, filenames in os.walk(mod.MOD_LOCATION):
+        files += len(filenames)
+        size += sum(os.stat(join(dirpath, f)).st_size for f in filenames)
+    return {"seconds": seconds, "bytes": size, "files": files}
+
+
+def bench_mod_list(params, workdir):
+    modids = _ark_root(params, workdir)
+    args = argparse.Namespace(
+        mod_storage_dir=modtool.DEFAULT_MOD_STORAGE_DIR, modid=[], json=False
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        modtool.mod_list(args)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        modtool.mod_list(args)
+        warm = time.perf_counter() - start
+    return {"seconds": cold, "warm_seconds": warm, "files": len(modids)}
+
+
+def bench_merge(params, workdir):
+    merge = load_merge()
+    lines = synth.gen_ini(params.ini_sections, params.ini_keys)
+    settings = synth.gen_merge_settings(params.ini_sections, params.ini_keys)
+    repeat = 50
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = list(merge.update_cfg_stream(settings, lines))
+    return {
+        "seconds": time.perf_counter() - start,
+        "bytes": repeat * sum(len(l) for l in lines),
+        "files": repeat,
+        "lines_out": len(out)
+    }
+
+
+BENCHMARKS = {
+    "compress": bench_compress,
+    "decompress": bench_decompress,
+    "decompress_file": bench_decompress_file,
+    "mod_install": bench_mod_install,
+    "mod_list": bench_mod_list,
+    "merge": bench_merge,
+}
+
+
+# Runner #####################################################################
+
+def _child(func, params, conn):
+    workdir = tempfile.mkdtemp(prefix="monark-bench-")
+    try:
+        result = func(params, workdir)
+        result["peak_rss_mb"] = \
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        conn.send(result)
+    except BaseException as err:
+        conn.send({"error": repr(err)})
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+        conn.close()
+
+
+def run_one(name, params) -> dict:
+    ctx = multiprocessing.get_context("fork")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(BENCHMARKS[name], params, child))
+    proc.start()
+    child.close()
+    result = parent.recv()
+    proc.join()
+
+    seconds = result.get("seconds")
+    if seconds:
+        if "bytes" in result:
+            result["mb_per_s"] = result["bytes"] / MB / seconds
+        if "files" in result:
+            result["files_per_s"] = result["files"] / seconds
+    return result
+
+
+def compare(results: dict, baseline: dict):
+    print("\n{0:<16} {1:<12} {2:>12} {3:>12} {4:>8}".format(
+        "benchmark", "metric", "baseline", "current", "change"
+    ))
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        for metric in ("mb_per_s", "files_per_s", "seconds", "peak_rss_mb"):
+            if metric not in result or metric not in old or not old[metric]:
+                continue
+            change = (result[metric] - old[metric]) / old[metric] * 100
+            print("{0:<16} {1:<12} {2:>12.2f} {3:>12.2f} {4:>+7.1f}%".format(
+                name, metric, old[metric], result[metric], change
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("-o", "--output", dest="output", action="store", default=None)
+    parser.add_argument("-c", "--compare", dest="compare", action="store", default=None)
+    parser.add_argument("-k", dest="only", action="append", default=[], choices=BENCHMARKS.keys())
+    parser.add_argument("--size", dest="size", action="store", type=int, default=64 * MB)
+    parser.add_argument("--compressibility", dest="compressibility", action="store", type=float, default=0.5)
+    parser.add_argument("--mods", dest="mods", action="store", type=int, default=4)
+    parser.add_argument("--files", dest="files", action="store", type=int, default=32)
+    parser.add_argument("--file-size", dest="file_size", action="store", type=int, default=MB)
+    parser.add_argument("--ini-sections", dest="ini_sections", action="store", type=int, default=20)
+    parser.add_argument("--ini-keys", dest="ini_keys", action="store", type=int, default=50)
+    parser.add_argument("-j", "--workers", dest="workers", action="store", type=int, default=1)
+    params = parser.parse_args()
+
+    results = {}
+    for name in params.only or BENCHMARKS.keys():
+        result = run_one(name, params)
+        results[name] = result
+        if "error" in result:
+            print("{0:<16} error: {1}".format(name, result["error"]))
+            continue
+        print("{0:<16} {1:8.3f}s {2:>10} {3:>10} {4:8.1f} MB peak RSS".format(
+            name, result["seconds"],
+            "{0:.1f} MB/s".format(result["mb_per_s"]) if "mb_per_s" in result else "",
+            "{0:.1f} f/s".format(result["files_per_s"]) if "files_per_s" in result else "",
+            result["peak_rss_mb"]
+        ))
+
+    report = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": vars(params)
+        },
+        "results": results
+    }
+    if params.output is not None:
+        with open(params.output, "wt") as out:
+            json.dump(report, out, indent=2)
+    if params.compare is not None:
+        with open(params.compare, "rt") as base:
+            compare(results, json.load(base))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Deterministic synthetic inputs: data of a given compressibility, .uasset.z
+files, fake ARK roots with workshop mods, and ini files for merge.py.
+"""
+
+import io
+import os
+import random
+
+from os.path import join
+
+from monark import mod
+from monark import modtool
+from monark import uassetz
+
+
+BLOCK_SIZE = 0x1000
+
+
+def gen_data(size: int, compressibility: float=0.5, seed: int=0) -> bytes:
+    """
+    Generates size bytes of data. Roughly compressibility of the 4 KiB blocks
+    are repeats of a few "stock" blocks, the rest are random.
+    """
+    rnd = random.Random(seed)
+    stock = [rnd.randbytes(64) * (BLOCK_SIZE // 64) for _ in range(8)]
+    out = bytearray()
+    while len(out) < size:
+        if rnd.random() < compressibility:
+            out += rnd.choice(stock)
+        else:
+            out += rnd.randbytes(BLOCK_SIZE)
+    return bytes(out[:size])
+
+
+def gen_uassetz(path: str, size: int=None, compressibility: float=0.5,
+                chunks: int=None, chunk_size: int=uassetz.DEFAULT_CHUNK_SIZE,
+                seed: int=0) -> int:
+    """
+    Writes a .uasset.z file. Give either size (in uncompressed bytes) or
+    chunks (number of full chunks).
+
+    :returns: uncompressed size
+    """
+    if size is None:
+        size = chunks * chunk_size
+    data = gen_data(size, compressibility, seed)
+    with open(path, "wb") as dest:
+        uassetz.compress(io.BytesIO(data), dest, chunk_size)
+    with open(path + ".uncompressed_size", "wt") as sidecar:
+        sidecar.write(str(size))
+    return size
+
+
+def gen_mod_info(name: bytes, maps) -> bytes:
+    return mod.ark_pack_mod_info(
+        mod.ArkModInfo(name, list(maps), b"\x00" * 6 + b"\xd5\x08")
+    )
+
+
+def gen_modmeta_info() -> bytes:
+    return mod.ark_pack_modmeta_info(mod.ArkModMetaInfo(mod.DEFAULT_MOD_METADATA))
+
+
+def gen_ark_root(root: str, n_mods: int=4, files_per_mod: int=32,
+                 file_size: int=0x80000, compressibility: float=0.5,
+                 mod_platform: str="WindowsNoEditor", seed: int=0) -> list:
+    """
+    Creates a fake ARK dedicated server root, with n_mods mods in the default
+    workshop storage dir. Half of each mod's files are .uasset.z assets, the
+    rest are copied as is; sizes vary from file_size / 4 to file_size.
+
+    :returns: list of mod ids
+    """
+    binpath = join(root, "ShooterGame", "Binaries", "Linux")
+    os.makedirs(binpath, exist_ok=True)
+    open(join(binpath, "ShooterGameServer"), "wb").close()
+    os.makedirs(join(root, mod.MOD_LOCATION), exist_ok=True)
+
+    rnd = random.Random(seed)
+    modids = []
+    for n in range(n_mods):
+        modid = str(900000000 + n)
+        modids.append(modid)
+        mod_root = join(root, modtool.DEFAULT_MOD_STORAGE_DIR, modid)
+        base = join(mod_root, mod_platform)
+        os.makedirs(join(base, "Assets", "Maps"), exist_ok=True)
+
+        mi = gen_mod_info("Bench Mod {0}".format(n).encode("utf8"), [b"BenchMap"])
+        for path in (join(mod_root, "mod.info"), join(base, "mod.info")):
+            with open(path, "wb") as mif:
+                mif.write(mi)
+        with open(join(base, "modmeta.info"), "wb") as mmif:
+            mmif.write(gen_modmeta_info())
+
+        for i in range(files_per_mod):
+            size = rnd.randrange(file_size // 4, file_size + 1)
+            subdir = "Maps" if i % 4 == 0 else ""
+            stem = join(base, "Assets", subdir, "F{0:04d}".format(i))
+            if i % 2 == 0:
+                gen_uassetz(stem + ".uasset.z", size, compressibility, seed=rnd.random())
+            else:
+                with open(stem + ".ubulk", "wb") as f:
+                    f.write(gen_data(size, compressibility, rnd.random()))
+    return modids
+
+
+def gen_ini(n_sections: int=20, keys_per_section: int=50, seed: int=0) -> list:
+    """Generates the lines of a GameUserSettings.ini-like file."""
+    rnd = random.Random(seed)
+    lines = []
+    for s in range(n_sections):
+        lines.append("[Section{0}]\n".format(s))
+        for k in range(keys_per_section):
+            lines.append("Key{0}={1}\n".format(k, rnd.randrange(1000)))
+        lines.append("\n")
+    return lines
+
+
+def gen_merge_settings(n_sections: int=20, keys_per_section: int=50,
+                       seed: int=1) -> dict:
+    """Settings to merge over gen_ini(): changes some keys, adds others."""
+    rnd = random.Random(seed)
+    settings = {}
+    for s in range(0, n_sections + 2, 2):
+        settings["Section{0}".format(s)] = {
+            "Key{0}".format(k): str(rnd.randrange(1000))
+            for k in range(0, keys_per_section + 10, 3)
+        }
+    return settings
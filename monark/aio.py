@@ -0,0 +1,352 @@
+"""
+asyncio versions of mod installation and uassetz decompression, for callers
+that can't block their event loop.
+
+All blocking work (file I/O and zlib) runs on a thread pool. Stages are
+connected by bounded asyncio queues, so a slow disk holds back reading and
+inflating instead of letting chunks pile up in memory.
+
+Progress is reported by calling progress(event) on the event loop, with a
+ProgressEvent, after each chunk (decompress_file) or file (install_mod).
+
+Cancelling a call waits for the threads it started, then removes anything it
+left half written (the dest file, or the mod's install dir).
+"""
+
+import os
+import stat
+import struct
+import asyncio
+import collections
+
+from os.path import exists, join, relpath
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Callable, Dict, List
+
+from . import mod
+from . import fsutil
+from . import modtool
+from . import uassetz
+
+
+ProgressEvent = collections.namedtuple("ProgressEvent", (
+    "kind",     # "chunk", "file", "mod_done" or "mod_failed"
+    "modid",    # None for decompress_file
+    "path",     # file the event is about (install dir for mod events)
+    "done",     # bytes written so far
+    "total"     # bytes to write in total
+))
+
+
+class _Calls:
+    """
+    Runs blocking calls on an executor, and remembers which are still running
+    (cancelling the awaiting task doesn't stop a thread).
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.running = set()
+
+    async def __call__(self, func, *args):
+        fut = self.executor.submit(func, *args)
+        self.running.add(fut)
+        fut.add_done_callback(self.running.discard)
+        return await asyncio.wrap_future(fut)
+
+    async def settle(self):
+        """Waits for every call to finish (or be cancelled)."""
+        if len(self.running) > 0:
+            await asyncio.wait([asyncio.wrap_future(f) for f in self.running])
+
+
+async def _cancel_all(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _open_for_decompress(source_path: str, dest_path: str, expected_size: int):
+    with open(source_path, "rb") as source:
+        main_header, chunk_headers = uassetz.read_chunk_table(source)
+        uassetz._check_expected_size(main_header, expected_size)
+        data_offset = source.tell()
+        src_fd = os.dup(source.fileno())
+
+    try:
+        dest_fd = os.open(
+            dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666
+        )
+    except OSError:
+        os.close(src_fd)
+        raise
+    try:
+        if stat.S_ISREG(os.fstat(dest_fd).st_mode):
+            fsutil.preallocate(dest_fd, main_header.uncompressed_total)
+            os.ftruncate(dest_fd, main_header.uncompressed_total)
+    except OSError:
+        os.close(src_fd)
+        os.close(dest_fd)
+        raise
+    return src_fd, dest_fd, data_offset, main_header, chunk_headers
+
+
+def _read_chunk(fd: int, size: int, offset: int) -> bytes:
+    data = os.pread(fd, size, offset)
+    if len(data) != size:
+        raise uassetz.DecompressionError("truncated chunk")
+    return data
+
+
+def _write_chunk(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while len(view) > 0:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+async def decompress_file(source_path: str, dest_path: str, workers: int=1,
+                          executor=None, expected_size: int=None,
+                          progress: Callable[[ProgressEvent], None]=None,
+                          modid: str=None):
+    """
+    Decompresses a compressed uasset file to dest_path, without blocking the
+    event loop.
+
+    Chunks are read, inflated and written in three stages. Up to 2 * workers
+    chunks are held between reading and writing at once.
+
+    :param workers:  number of chunks to inflate at once
+    :param executor: thread pool to run on; a temporary one is made if None
+    :param progress: called with a "chunk" ProgressEvent after each chunk
+    :param modid:    modid to put in progress events
+    :raises uassetz.UassetZError: as uassetz.decompress_file()
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(workers + 1)
+    call = _Calls(executor)
+    src_fd = dest_fd = None
+    try:
+        src_fd, dest_fd, offset, main_header, chunk_headers = await call(
+            _open_for_decompress, source_path, dest_path, expected_size
+        )
+        queue = asyncio.Queue(2 * workers)
+
+        async def read_and_inflate():
+            coffset, uoffset = offset, 0
+            try:
+                for csize, usize in chunk_headers:
+                    data = await call(_read_chunk, src_fd, csize, coffset)
+                    inflated = asyncio.ensure_future(
+                        call(uassetz._inflate_chunk, data, usize)
+                    )
+                    await queue.put((inflated, uoffset))
+                    coffset += csize
+                    uoffset += usize
+            except Exception as exc:
+                # Passed along in place of the chunk, for the writer to raise.
+                await queue.put((exc, None))
+
+        reader = asyncio.ensure_future(read_and_inflate())
+        pending = set()
+        try:
+            done = 0
+            for _ in chunk_headers:
+                inflated, uoffset = await queue.get()
+                if isinstance(inflated, Exception):
+                    raise inflated
+                pending.add(inflated)
+                chunk = await inflated
+                pending.discard(inflated)
+                await call(_write_chunk, dest_fd, chunk, uoffset)
+                done += len(chunk)
+                if progress is not None:
+                    progress(ProgressEvent(
+                        "chunk", modid, dest_path, done,
+                        main_header.uncompressed_total
+                    ))
+            await reader
+        finally:
+            while not queue.empty():
+                inflated, uoffset = queue.get_nowait()
+                if uoffset is not None:     # not the reader's error.
+                    pending.add(inflated)
+            await _cancel_all([reader, *pending])
+    except BaseException:
+        await call.settle()
+        if dest_fd is not None:
+            await call(_unlink_quietly, dest_path)
+        raise
+    finally:
+        await call.settle()
+        for fd in (src_fd, dest_fd):
+            if fd is not None:
+                os.close(fd)
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+def _plan(storage_path: str, install_path: str):
+    dirs, jobs = modtool.plan_mod_install(storage_path, install_path)
+    sizes = {job: modtool.expected_install_size(job) for job in jobs}
+    return dirs, jobs, sizes
+
+
+def _make_dirs(install_path: str, dirs: List[str]):
+    os.mkdir(install_path)
+    for dirpath in dirs:
+        os.mkdir(dirpath)
+
+
+def _finish_install(modid: str, storage_path: str, install_path: str,
+                    jobs: List[modtool.InstallJob]):
+    modtool.write_modfile(modid, install_path)
+    modtool.write_manifest(install_path, {
+        relpath(job.srcpath, storage_path): modtool.manifest_entry(job)
+        for job in jobs
+    })
+
+
+def _remove_install(install_path: str):
+    if exists(install_path):
+        fsutil.rmtree(install_path)
+    _unlink_quietly(install_path + ".mod")
+
+
+async def install_mod(modid: str, mod_storage_dir: str, mod_platform: str,
+                      ark_root: str=".", workers: int=1, executor=None,
+                      store=None,
+                      progress: Callable[[ProgressEvent], None]=None):
+    """
+    Installs a mod, like modtool.do_mod_install(), without blocking the
+    event loop. Paths are relative to ark_root rather than the working dir,
+    so several ARK roots can be served from one process.
+
+    Files are handed to workers file tasks through a bounded queue, biggest
+    first; each .uasset.z is decompressed with decompress_file().
+
+    :param progress: called with a "file" ProgressEvent after each file
+    :returns: False if the mod was already installed, otherwise True
+    """
+    storage_path = join(ark_root, mod_storage_dir, modid, mod_platform)
+    install_path = join(ark_root, mod.MOD_LOCATION, modid)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(2 * workers)
+    call = _Calls(executor)
+    try:
+        if await call(exists, install_path + ".mod"):
+            return False
+        dirs, jobs, sizes = await call(_plan, storage_path, install_path)
+        total = sum(sizes.values())
+        await call(_make_dirs, install_path, dirs)
+
+        try:
+            queue = asyncio.Queue(workers)
+            done = 0
+
+            async def feed():
+                for job in sorted(jobs, key=lambda job: job.size, reverse=True):
+                    await queue.put(job)
+                for _ in range(workers):
+                    await queue.put(None)
+
+            async def install_files():
+                nonlocal done
+                while True:
+                    job = await queue.get()
+                    if job is None:
+                        return
+                    if store is not None:
+                        await call(store.install, job)
+                    elif job.compressed:
+                        await decompress_file(
+                            job.srcpath, job.dstpath, workers, executor,
+                            job.expected_size
+                        )
+                    else:
+                        await call(fsutil.copy_file, job.srcpath, job.dstpath)
+                    done += sizes[job]
+                    if progress is not None:
+                        progress(ProgressEvent(
+                            "file", modid, job.dstpath, done, total
+                        ))
+
+            tasks = [asyncio.ensure_future(feed())]
+            tasks += [
+                asyncio.ensure_future(install_files()) for _ in range(workers)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                await _cancel_all(tasks)
+
+            await call(_finish_install, modid, storage_path, install_path, jobs)
+        except BaseException:
+            await call.settle()
+            await call(_remove_install, install_path)
+            raise
+        return True
+    finally:
+        await call.settle()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+async def install_mods(modids: List[str], mod_storage_dir: str,
+                       mod_platform: str, ark_root: str=".", jobs: int=1,
+                       workers: int=1, store=None,
+                       progress: Callable[[ProgressEvent], None]=None
+                       ) -> Dict[str, Exception]:
+    """
+    Installs mods, up to jobs at once, sharing one thread pool.
+    As with "monark mod install", one mod failing doesn't stop the others.
+
+    :param progress: called with ProgressEvents; as well as install_mod()'s
+                     events, there's a "mod_done" or "mod_failed" per mod
+    :returns: modid -> None if it installed (or already was), or the error
+    """
+    results = {}
+    limit = asyncio.Semaphore(jobs)
+
+    async def one(modid, executor):
+        install_path = join(ark_root, mod.MOD_LOCATION, modid)
+        async with limit:
+            try:
+                await install_mod(
+                    modid, mod_storage_dir, mod_platform, ark_root, workers,
+                    executor, store, progress
+                )
+            except (OSError, struct.error, uassetz.UassetZError) as err:
+                results[modid] = err
+                kind = "mod_failed"
+            else:
+                results[modid] = None
+                kind = "mod_done"
+        if progress is not None:
+            progress(ProgressEvent(kind, modid, install_path, None, None))
+
+    executor = ThreadPoolExecutor(2 * workers * jobs)
+    try:
+        tasks = [
+            asyncio.ensure_future(one(modid, executor)) for modid in modids
+            if modid not in modtool.OVERRIDE_MODIDS
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await _cancel_all(tasks)
+    finally:
+        executor.shutdown(wait=False)
+    return results
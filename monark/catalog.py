@@ -0,0 +1,188 @@
+"""
+Persistent catalog of stored and installed mods, used by "mod list".
+
+The catalog is kept as JSON at CATALOG_LOCATION (relative to the ARK root).
+For each mod, it caches what mod.info says (name, maps).
+
+Cached data is stamped with the mtimes/sizes of the files it came from:
+ - the storage dir and install dir, for the list of mod ids.
+ - each stored mod's dir, for whether it's empty (Steam leaves empty dirs
+   behind for mods that aren't downloaded).
+ - each mod's dir and mod.info file (and .mod file, if installed).
+A warm refresh is just a stat of each of those, and only mods whose stamps
+have changed are read again.
+
+The stamps don't cover anything deeper in a mod's tree, so the size of the
+storage and install dirs isn't cached: refresh() only works it out (walking
+every tree) when asked to. A mod.info rewritten in place within the mtime
+resolution, with the same size, would also be missed.
+"""
+
+import os
+import sys
+import json
+import struct
+
+from os.path import join, isdir
+
+from . import mod
+
+
+CATALOG_LOCATION = ".monark/catalog.json"
+CATALOG_VERSION = 3
+
+
+def _stamp(*paths) -> list:
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append([st.st_mtime_ns, st.st_size])
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+        for filename in filenames:
+            try:
+                total += os.stat(join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _scan_side(path: str, stamp: list) -> dict:
+    ent = {
+        "path": path,
+        "stamp": stamp,
+        "name": None,
+        "maps": [],
+        "error": None
+    }
+    try:
+        with open(join(path, "mod.info"), "rb") as mif:
+            mi = mod.ark_unpack_mod_info(mif.read())
+        ent["name"] = mi.mod_name.decode("utf8")
+        ent["maps"] = [m.decode("utf8") for m in mi.map_filenames]
+    except (IOError, struct.error, UnicodeDecodeError) as err:
+        ent["error"] = str(err)
+    return ent
+
+
+class Catalog:
+    def __init__(self, path: str=CATALOG_LOCATION):
+        self.path = path
+        self.dirty = False
+        try:
+            with open(path, "rt") as cf:
+                data = json.load(cf)
+            if data.get("version") != CATALOG_VERSION:
+                raise ValueError("catalog version mismatch")
+        except (OSError, ValueError, AttributeError):
+            data = {"version": CATALOG_VERSION, "roots": {}, "mods": {}}
+            self.dirty = True
+        self.data = data
+
+    def _list_ids(self, key: str, rootpath: str, nonempty: bool) -> list:
+        stamp = _stamp(rootpath)
+        cached = self.data["roots"].get(key)
+        if cached is None or cached["path"] != rootpath \
+                or cached["stamp"] != stamp:
+            ids = []
+            if isdir(rootpath):
+                ids = [m for m in os.listdir(rootpath) if m.isnumeric()]
+            cached = self.data["roots"][key] = {
+                "path": rootpath, "stamp": stamp, "ids": ids, "empty": {}
+            }
+            self.dirty = True
+        if not nonempty:
+            return cached["ids"]
+
+        # Whether a mod's dir is empty only shows in its own stamp.
+        ids = []
+        for modid in cached["ids"]:
+            mstamp = _stamp(join(rootpath, modid))
+            known = cached["empty"].get(modid)
+            if known is None or known[0] != mstamp:
+                try:
+                    empty = len(os.listdir(join(rootpath, modid))) == 0
+                except OSError:
+                    empty = True
+                known = cached["empty"][modid] = [mstamp, empty]
+                self.dirty = True
+            if not known[1]:
+                ids.append(modid)
+        return ids
+
+    def _side(self, modid: str, key: str, path: str, stamp: list) -> dict:
+        ent = self.data["mods"].setdefault(modid, {})
+        cached = ent.get(key)
+        if cached is None or cached["path"] != path \
+                or cached["stamp"] != stamp:
+            cached = ent[key] = _scan_side(path, stamp)
+            self.dirty = True
+        return cached
+
+    def refresh(self, mod_storage_dir: str,
+                mod_location: str=mod.MOD_LOCATION,
+                sizes: bool=False) -> dict:
+        """
+        Brings the catalog up to date.
+
+        :param sizes: also work out the size of each side (slow: every file
+                      of every mod is stat'ed)
+        :returns: dict of modid to {"storage": side, "install": side},
+                  where a side is None if the mod isn't stored/installed.
+        """
+        stored = self._list_ids("storage", mod_storage_dir, True)
+        installed = self._list_ids("install", mod_location, False)
+
+        mods = {}
+        for modid in stored:
+            sdir = join(mod_storage_dir, modid)
+            side = self._side(
+                modid, "storage", sdir, _stamp(sdir, join(sdir, "mod.info"))
+            )
+            mods.setdefault(modid, {"storage": None, "install": None})
+            mods[modid]["storage"] = side
+        for modid in installed:
+            idir = join(mod_location, modid)
+            side = self._side(
+                modid, "install", idir,
+                _stamp(idir, join(idir, "mod.info"), idir + ".mod")
+            )
+            mods.setdefault(modid, {"storage": None, "install": None})
+            mods[modid]["install"] = side
+
+        # Forget mods that have gone away entirely.
+        for modid in list(self.data["mods"].keys()):
+            if modid not in mods:
+                del self.data["mods"][modid]
+                self.dirty = True
+            else:
+                for key in ("storage", "install"):
+                    if mods[modid][key] is None and \
+                            self.data["mods"][modid].pop(key, None) is not None:
+                        self.dirty = True
+
+        if sizes:
+            for sides in mods.values():
+                for key, side in sides.items():
+                    if side is not None:
+                        sides[key] = dict(side, size=_tree_size(side["path"]))
+        return mods
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".atom", "wt") as cf:
+                json.dump(self.data, cf)
+            os.replace(self.path + ".atom", self.path)
+            self.dirty = False
+        except OSError as err:
+            print("warning: could not save catalog: " + str(err), file=sys.stderr)
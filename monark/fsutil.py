@@ -0,0 +1,284 @@
+"""
+Filesystem helpers.
+
+rmtree() removes directory trees a directory at a time: each directory is
+scanned with os.scandir on a directory fd, and its files unlinked relative to
+that fd, optionally with several directories in flight on a thread pool.
+trash() renames a tree into a trash dir instead, and leaves deleting it to a
+detached background process, so the caller can carry on straight away.
+
+copy_file() copies with the cheapest method the system supports, in order:
+ - reflink (FICLONE ioctl): btrfs, xfs and friends share the extents, no data
+   is copied at all.
+ - os.copy_file_range: the kernel copies, possibly server side/offloaded.
+ - os.sendfile: the kernel copies, without going through userspace.
+ - a read/write loop with a fixed size buffer.
+Each method carries on from wherever the previous one gave up.
+"""
+
+import os
+import sys
+import uuid
+import errno
+import ctypes
+import ctypes.util
+import subprocess
+
+from os.path import join, basename, abspath, dirname
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+FICLONE = 0x40049409        # _IOW(0x94, 9, int)
+COPY_BUFFER_SIZE = 0x100000
+
+# errnos that mean "this method doesn't work here", rather than a real error.
+FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+    errno.ENOTSUP, errno.ENOTTY, errno.EBADF, errno.EPERM
+}
+
+
+def _reflink(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+    if fcntl is None or offset != 0:
+        return offset
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as err:
+        if err.errno not in FALLBACK_ERRNOS:
+            raise
+        return offset
+    return size
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+    if not hasattr(os, "copy_file_range"):
+        return offset
+    try:
+        while offset < size:
+            n = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+            if n == 0:
+                break
+            offset += n
+    except OSError as err:
+        if err.errno not in FALLBACK_ERRNOS:
+            raise
+    return offset
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+    if not hasattr(os, "sendfile"):
+        return offset
+    try:
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while offset < size:
+            n = os.sendfile(dst_fd, src_fd, offset, size - offset)
+            if n == 0:
+                break
+            offset += n
+    except OSError as err:
+        if err.errno not in FALLBACK_ERRNOS:
+            raise
+    return offset
+
+
+def _copy_loop(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+    # Reads to EOF, in case the file grew since it was stat'd.
+    buf = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while True:
+        n = os.readv(src_fd, [buf])
+        if n == 0:
+            break
+        written = 0
+        while written < n:
+            written += os.write(dst_fd, view[written:n])
+        offset += n
+    return offset
+
+
+COPY_METHODS = (_reflink, _copy_file_range, _sendfile, _copy_loop)
+
+
+def copy_fd(src_fd: int, dst_fd: int):
+    """Copies the contents of src_fd to dst_fd, which should be empty."""
+    size = os.fstat(src_fd).st_size
+    offset = 0
+    for method in COPY_METHODS:
+        offset = method(src_fd, dst_fd, offset, size)
+        if offset >= size:
+            break
+
+
+def copy_file(srcpath: str, dstpath: str):
+    """Copies srcpath to dstpath, using constant memory."""
+    with open(srcpath, "rb", buffering=0) as src, \
+            open(dstpath, "wb", buffering=0) as dst:
+        copy_fd(src.fileno(), dst.fileno())
+
+
+def preallocate(fd: int, size: int, offset: int=0):
+    """
+    Reserves space for size bytes from offset in a file, so it can be laid
+    out in one go rather than grown extent by extent. Does nothing where
+    posix_fallocate isn't supported.
+    """
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, offset, size)
+    except OSError as err:
+        if err.errno not in FALLBACK_ERRNOS | {errno.ENODEV, errno.ESPIPE}:
+            raise
+
+
+def _libc_syncfs():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).syncfs
+    except (OSError, AttributeError):
+        return None
+
+
+def syncfs(path: str):
+    """
+    Flushes everything written to the filesystem holding path. One syncfs()
+    is much cheaper than an fsync() per file after writing a lot of files.
+    Falls back to sync() (every filesystem) where syncfs() isn't available.
+    """
+    libc_syncfs = _libc_syncfs()
+    if libc_syncfs is None:
+        os.sync()
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if libc_syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path: str):
+    """Flushes a directory's entries, e.g. after renaming things into it."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_DIR_FD_OK = os.unlink in os.supports_dir_fd and os.scandir in os.supports_fd
+
+
+def _clear_dir(path: str, verbose: bool=False) -> list:
+    """
+    Unlinks everything in path that isn't a directory.
+
+    :returns: paths of the subdirectories of path
+    """
+    subdirs = []
+    if _DIR_FD_OK:
+        dir_fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+        try:
+            with os.scandir(dir_fd) as it:
+                for ent in it:
+                    if ent.is_dir(follow_symlinks=False):
+                        subdirs.append(join(path, ent.name))
+                        continue
+                    if verbose:
+                        print("removing '%s'" % join(path, ent.name))
+                    os.unlink(ent.name, dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+    else:
+        with os.scandir(path) as it:
+            for ent in it:
+                if ent.is_dir(follow_symlinks=False):
+                    subdirs.append(ent.path)
+                    continue
+                if verbose:
+                    print("removing '%s'" % ent.path)
+                os.unlink(ent.path)
+    return subdirs
+
+
+def rmtree(path: str, workers: int=1, verbose: bool=False):
+    """
+    Removes the directory tree at path. Symlinks are removed, not followed.
+
+    :param path:    directory to remove
+    :param workers: number of directories to clear at once
+    :param verbose: print each path as it's removed
+    """
+    dirs = [path]
+    level = [path]
+    with ThreadPoolExecutor(max(workers, 1)) as pool:
+        while len(level) > 0:
+            next_level = []
+            for subdirs in pool.map(
+                lambda dirpath: _clear_dir(dirpath, verbose), level
+            ):
+                next_level.extend(subdirs)
+            dirs.extend(next_level)
+            level = next_level
+
+    for dirpath in reversed(dirs):
+        if verbose:
+            print("removing '%s'" % dirpath)
+        os.rmdir(dirpath)
+
+
+def trash(path: str, trash_dir: str):
+    """
+    Atomically moves path into trash_dir, then starts a detached process to
+    empty trash_dir. trash_dir should be on the same filesystem as path;
+    if it isn't, path is removed with rmtree() before returning.
+    """
+    os.makedirs(trash_dir, exist_ok=True)
+    target = join(trash_dir, "{0}.{1}".format(basename(path), uuid.uuid4().hex))
+    try:
+        os.rename(path, target)
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+        rmtree(path)
+        return
+
+    # The child must be able to import this module wherever it was imported
+    # from (e.g. a source checkout), whatever the caller's working dir is.
+    package_parent = dirname(dirname(abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (package_parent, env.get("PYTHONPATH")) if p
+    )
+    subprocess.Popen(
+        [sys.executable, "-m", __name__, abspath(trash_dir)],
+        cwd="/",
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def empty_trash(trash_dir: str, workers: int=1):
+    """Removes everything in trash_dir. Other processes may be at it too."""
+    for ent in os.scandir(trash_dir):
+        try:
+            if ent.is_dir(follow_symlinks=False):
+                rmtree(ent.path, workers)
+            else:
+                os.unlink(ent.path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == "__main__":
+    empty_trash(sys.argv[1])
@@ -43,42 +43,46 @@ byte: mod type (typically 1)
 <modmeta.info follows>
 """
 
-import io
 import struct
 import collections
 
-from typing import Tuple, Union, Sequence, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Union, Sequence, Mapping, Iterable, Dict
 
 # Utility functions:
 # ------------------
 
+U8 = struct.Struct("<B")
+U32 = struct.Struct("<L")
+U64 = struct.Struct("<Q")
+
 # integer r/w
 
 def read_u8(source) -> int:
-    b, = struct.unpack("<B", source.read(1))
+    b, = U8.unpack(source.read(1))
     return b
 
 
 def read_u32(source) -> int:
-    d, = struct.unpack("<L", source.read(4))
+    d, = U32.unpack(source.read(4))
     return d
 
 
 def read_u64(source) -> int:
-    q, = struct.unpack("<Q", source.read(8))
+    q, = U64.unpack(source.read(8))
     return q
 
 
 def write_u8(dest, b: int):
-    dest.write(struct.pack("<B", b))
+    dest.write(U8.pack(b))
 
 
 def write_u32(dest, d: int):
-    dest.write(struct.pack("<L", d))
+    dest.write(U32.pack(d))
 
 
 def write_u64(dest, q: int):
-    dest.write(struct.pack("<Q", q))
+    dest.write(U64.pack(q))
 
 
 # string r/w
@@ -111,7 +115,7 @@ def write_string_array(dest, items: Sequence[bytes]):
 # kvp r/w
 
 def read_kvps(source) -> Sequence[Tuple[bytes, bytes]]:
-    """Read """
+    """Read a count prefixed list of string pairs."""
     kvps = []
     n_kvps = read_u32(source)
     for _ in range(0, n_kvps):
@@ -126,6 +130,61 @@ def write_kvps(dest, kvps: Sequence[Tuple[bytes, bytes]]):
         write_string(dest, v)
 
 
+# Offset based parsing/packing
+# ----------------------------
+# These work directly on a buffer (ideally a memoryview) instead of a stream.
+# unpack_* functions take an offset and return (value, offset after value).
+# pack_* functions append the encoded parts to a list, to be joined once.
+
+def unpack_string(buf, offset: int) -> Tuple[bytes, int]:
+    strlen, = U32.unpack_from(buf, offset)
+    offset += 4
+    end = offset + strlen
+    if end > len(buf):
+        raise struct.error("string runs past the end of the data")
+    return bytes(buf[offset:max(end - 1, offset)]), end
+
+
+def unpack_string_array(buf, offset: int) -> Tuple[Sequence[bytes], int]:
+    n_items, = U32.unpack_from(buf, offset)
+    offset += 4
+    items = []
+    for _ in range(0, n_items):
+        item, offset = unpack_string(buf, offset)
+        items.append(item)
+    return items, offset
+
+
+def unpack_kvps(buf, offset: int) -> Tuple[Sequence[Tuple[bytes, bytes]], int]:
+    n_kvps, = U32.unpack_from(buf, offset)
+    offset += 4
+    kvps = []
+    for _ in range(0, n_kvps):
+        k, offset = unpack_string(buf, offset)
+        v, offset = unpack_string(buf, offset)
+        kvps.append((k, v))
+    return kvps, offset
+
+
+def pack_string(parts: list, string: bytes):
+    parts.append(U32.pack(len(string) + 1))
+    parts.append(string)
+    parts.append(b"\x00")
+
+
+def pack_string_array(parts: list, items: Sequence[bytes]):
+    parts.append(U32.pack(len(items)))
+    for item in items:
+        pack_string(parts, item)
+
+
+def pack_kvps(parts: list, kvps: Sequence[Tuple[bytes, bytes]]):
+    parts.append(U32.pack(len(kvps)))
+    for k, v in kvps:
+        pack_string(parts, k)
+        pack_string(parts, v)
+
+
 # specific file parsers
 # ---------------------
 
@@ -141,20 +200,22 @@ ArkModInfo = collections.namedtuple("ArkModInfo", (
 
 
 def ark_unpack_mod_info(data: bytes) -> ArkModInfo:
-    source = io.BytesIO(data)
+    buf = memoryview(data)
+    mod_name, offset = unpack_string(buf, 0)
+    map_filenames, offset = unpack_string_array(buf, offset)
     return ArkModInfo(
-        read_string(source),
-        read_string_array(source),
-        source.read(8)
+        mod_name,
+        map_filenames,
+        bytes(buf[offset:offset + 8])
     )
 
 
 def ark_pack_mod_info(struct: ArkModInfo) -> bytes:
-    dest = io.BytesIO()
-    write_string(struct[0])
-    write_string_array(struct[1])
-    dest.write(struct[2])
-    return dest.getvalue()
+    parts = []
+    pack_string(parts, struct[0])
+    pack_string_array(parts, struct[1])
+    parts.append(struct[2])
+    return b"".join(parts)
 
 
 ArkModMetaInfo = collections.namedtuple("ArkModMetaInfo", (
@@ -163,14 +224,14 @@ ArkModMetaInfo = collections.namedtuple("ArkModMetaInfo", (
 
 
 def ark_unpack_modmeta_info(data: bytes) -> ArkModMetaInfo:
-    source = io.BytesIO(data)
-    return ArkModMetaInfo(read_kvps(source))
+    kvps, _ = unpack_kvps(memoryview(data), 0)
+    return ArkModMetaInfo(kvps)
 
 
 def ark_pack_modmeta_info(struct: ArkModMetaInfo) -> bytes:
-    dest = io.BytesIO()
-    write_kvps(dest, struct[0])
-    return dest.getvalue()
+    parts = []
+    pack_kvps(parts, struct[0])
+    return b"".join(parts)
 
 
 ArkModfile = collections.namedtuple("ArkModfile", (
@@ -185,28 +246,69 @@ ArkModfile = collections.namedtuple("ArkModfile", (
 
 
 def ark_unpack_modfile(data: bytes) -> ArkModfile:
-    source = io.BytesIO(data)
+    buf = memoryview(data)
+    mod_id, = U64.unpack_from(buf, 0)
+    mod_name, offset = unpack_string(buf, 8)
+    mod_path, offset = unpack_string(buf, offset)
+    map_filenames, offset = unpack_string_array(buf, offset)
+    mod_magic = bytes(buf[offset:offset + 8])
+    mod_type, = U8.unpack_from(buf, offset + 8)
+    metadata, _ = unpack_kvps(buf, offset + 9)
     return ArkModfile(
-        read_u64(source),
-        read_string(source),
-        read_string(source),
-        read_string_array(source),
-        source.read(8),
-        read_u8(source),
-        read_kvps(source)
+        mod_id,
+        mod_name,
+        mod_path,
+        map_filenames,
+        mod_magic,
+        mod_type,
+        metadata
     )
 
 
 def ark_pack_modfile(struct: ArkModfile) -> bytes:
-    dest = io.BytesIO()
-    write_u64(dest, struct[0])
-    write_string(dest, struct[1])
-    write_string(dest, struct[2])
-    write_string_array(dest, struct[3])
-    dest.write(struct[4])
-    write_u8(dest, struct[5])
-    write_kvps(dest, struct[6])
-    return dest.getvalue()
+    parts = [U64.pack(struct[0])]
+    pack_string(parts, struct[1])
+    pack_string(parts, struct[2])
+    pack_string_array(parts, struct[3])
+    parts.append(struct[4])
+    parts.append(U8.pack(struct[5]))
+    pack_kvps(parts, struct[6])
+    return b"".join(parts)
+
+
+# bulk parsing
+# ------------
+
+def ark_unpacker_for(path: str):
+    """Picks the unpack function for a file, going by its name."""
+    if path.endswith(".mod"):
+        return ark_unpack_modfile
+    if path.endswith("modmeta.info"):
+        return ark_unpack_modmeta_info
+    if path.endswith("mod.info"):
+        return ark_unpack_mod_info
+    raise ValueError("unknown ARK mod file type: " + path)
+
+
+def ark_unpack_many(paths: Iterable[str], workers: int=8) -> Dict[str, object]:
+    """
+    Reads and parses many mod.info, modmeta.info and .mod files at once.
+    Files are read on up to workers threads, which helps on network storage.
+
+    :returns: dict of path to the parsed namedtuple, or to the OSError or
+              struct.error raised while reading/parsing it.
+    """
+    def unpack(path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            return ark_unpacker_for(path)(data)
+        except (OSError, struct.error) as err:
+            return err
+
+    paths = list(paths)
+    with ThreadPoolExecutor(max(workers, 1)) as pool:
+        return dict(zip(paths, pool.map(unpack, paths)))
 
 
 MOD_LOCATION = "ShooterGame/Content/Mods"
@@ -222,9 +324,9 @@ def ark_gen_modfile(modid: Union[int, str],
     mi = ark_unpack_mod_info(modinfo)
     if modmetainfo is not None:
         mmi = ark_unpack_modmeta_info(modmetainfo)
-        meta_kvps = mmi.kvps
+        meta_kvps = list(mmi.kvps)
     else:
-        meta_kvps = DEFAULT_MOD_METADATA
+        meta_kvps = list(DEFAULT_MOD_METADATA)
 
     for k, v in meta_kvps:
         if k == b"ModType":
@@ -232,7 +334,7 @@ def ark_gen_modfile(modid: Union[int, str],
             break
     else:
         mod_type = 1
-        meta_kvps.insert((b"ModType", b"1"), 0)
+        meta_kvps.insert(0, (b"ModType", b"1"))
 
     amf = ArkModfile(
         int(modid),
@@ -1,17 +1,27 @@
 import os
 import sys
+import json
+import time
 import struct
+import heapq
 import collections
 
+import shutil
 import argparse
 
-from os.path import exists, join, relpath, isdir
+from os.path import exists, join, relpath, isdir, normpath
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from typing import Tuple, List
 
 from . import mod
+from . import stats
+from . import fsutil
+from . import catalog
+from . import objstore
 from . import uassetz
+from . import watch
 
 
 MOD_APPID = "346110"
@@ -65,21 +75,25 @@ def rm(filep, verbose=False):
     os.unlink(filep)
 
 
-def recrm(direc, verbose=False):
-    for dirpath, dirnames, filenames in os.walk(direc, topdown=False, followlinks=False):
-        for dirname in dirnames:
-            dirname = join(dirpath, dirname)
-            if verbose:
-                print("removing '%s'" % filename)
-            os.rmdir(dirname)
-        for filename in filenames:
-            filename = join(dirpath, filename)
-            if verbose:
-                print("removing '%s'" % filename)
-            os.unlink(filename)
-    if verbose:
-        print("removing '%s'" % direc)
-    os.rmdir(direc)
+def recrm(direc, verbose=False, workers=1):
+    fsutil.rmtree(direc, workers, verbose)
+
+
+# Trees removed with trash=True are moved here, then deleted in the background.
+# Outside the Mods dir, but normally on the same filesystem, so trashing a
+# tree is just a rename.
+TRASH_LOCATION = ".monark/trash"
+
+
+def remove_tree(direc, workers=1, trash=False):
+    if trash:
+        fsutil.trash(direc, TRASH_LOCATION)
+    else:
+        recrm(direc, workers=workers)
+
+
+def open_store(args):
+    return objstore.ObjectStore() if args.use_store else None
 
     
 
@@ -88,14 +102,27 @@ def recrm(direc, verbose=False):
 #################
 
 def modtool(args):
-    # Make storage dir relative to ark root
-    args.mod_storage_dir = relpath(args.mod_storage_dir, args.ark_root)
-    # Change to ark root dir.
-    os.chdir(args.ark_root)
+    # Stats output paths are relative to where we were run from.
+    if args.stats_json:
+        args.stats_json = os.path.abspath(args.stats_json)
+    if args.stats_prom:
+        args.stats_prom = os.path.abspath(args.stats_prom)
+
+    # Commands like "pack" work on plain directories, not an ark install.
+    if args.in_ark_root:
+        # The first ark root is the one we work in; mods are fanned out from
+        # there to any others.
+        roots = args.ark_root or ["./"]
+        args.ark_root = roots[0]
+        args.extra_roots = [os.path.abspath(root) for root in roots[1:]]
+        # Make storage dir relative to ark root
+        args.mod_storage_dir = relpath(args.mod_storage_dir, args.ark_root)
+        # Change to ark root dir.
+        os.chdir(args.ark_root)
 
     # Resolve mod_platform
     # Note: ark dedicated servers seem to need the Windows versions of mod files.
-    if args.mod_platform is None:
+    if args.in_ark_root and args.mod_platform is None:
         platform = ark_platform()
         if platform == "Linux" and not is_dedicated():
             args.mod_platform = "LinuxNoEditor"
@@ -104,40 +131,236 @@ def modtool(args):
         else:
             args.mod_platform = "WindowsNoEditor"
 
+    if args.stats or args.stats_json or args.stats_prom:
+        collector = stats.enable()
+        try:
+            return args.mod_func(args)
+        finally:
+            if args.stats:
+                print(collector.summary())
+            if args.stats_json:
+                collector.write_json(args.stats_json)
+            if args.stats_prom:
+                collector.write_prometheus(
+                    args.stats_prom, {"command": args.mod_func.__name__}
+                )
+
     return args.mod_func(args)
 
 # Mod installation ###########################################################
 
-def do_mod_install(modid: str, mod_storage_dir: str, mod_platform: str):
+def estimate_mod_size(modid: str, mod_storage_dir: str, mod_platform: str) -> int:
+    """
+    Estimates the installed size of a mod, using the uncompressed total in
+    the header of each .uasset.z, and the size of every other file.
+    """
+    return plan_mod_size(modid, mod_storage_dir, mod_platform).size
+
+
+ModSizePlan = collections.namedtuple("ModSizePlan", (
+    "files",        # number of files to install
+    "compressed",   # how many of them are .uasset.z files
+    "size",         # total installed size
+    "inflate_size", # how much of that comes from decompressing
+    "disk_size",    # installed size, rounded up to whole blocks per file
+    "largest"       # [(size, path)] of the biggest files, biggest first
+))
+
+
+def plan_mod_size(modid: str, mod_storage_dir: str, mod_platform: str,
+                  block_size: int=1, n_largest: int=5) -> ModSizePlan:
+    """
+    Works out how much a mod will take up installed, from only the main
+    header of each .uasset.z, and the size of every other file.
+    """
     storage_path = join(mod_storage_dir, modid, mod_platform)
-    install_path = join(mod.MOD_LOCATION, modid)
-
-    if exists(install_path + ".mod"):
-        print("mod {0} already installed.".format(modid))
-        return
-
-    os.mkdir(install_path)
+    files = compressed = total = inflate_total = disk_total = 0
+    sizes = []
+    for sdir_path, dirnames, filenames in os.walk(
+        storage_path,
+        followlinks=True
+    ):
+        for filename in filenames:
+            if filename.endswith(".uasset.z.uncompressed_size"):
+                continue
+            srcpath = join(sdir_path, filename)
+            if filename.endswith(".uasset.z"):
+                with open(srcpath, "rb") as src:
+                    size = uassetz.read_main_header(src).uncompressed_total
+                compressed += 1
+                inflate_total += size
+            else:
+                size = os.stat(srcpath).st_size
+            files += 1
+            total += size
+            disk_total += -(-size // block_size) * block_size
+            sizes.append((size, srcpath))
+    return ModSizePlan(
+        files, compressed, total, inflate_total, disk_total,
+        heapq.nlargest(n_largest, sizes)
+    )
+
+
+def run_mod_jobs(verb: str, func, modids: List[str], jobs: int,
+                 mod_storage_dir: str, mod_platform: str, **kwargs) -> int:
+    """
+    Calls func(modid, mod_storage_dir, mod_platform, log=..., **kwargs) for
+    each modid, on up to jobs threads. With more than one job, the largest
+    mods are started first and each mod's output is printed as one block
+    when it finishes.
+    Failures are reported per mod, and don't stop the other mods.
+
+    :returns: 0 if every mod succeeded, otherwise 1
+    """
+    todo = []
+    for modid in modids:
+        if modid in OVERRIDE_MODIDS:
+            print("ignoring special modid %s" % modid)
+            continue
+        todo.append(modid)
 
+    def job(modid, log):
+        try:
+            func(modid, mod_storage_dir, mod_platform, log=log, **kwargs)
+            return True
+        except (OSError, struct.error, uassetz.UassetZError) as err:
+            log("failed to {0} {1}: {2}".format(verb, modid, err))
+            return False
+
+    if jobs <= 1:
+        results = [job(modid, print) for modid in todo]
+        return 0 if all(results) else 1
+
+    sizes = {}
+    for modid in todo:
+        try:
+            sizes[modid] = estimate_mod_size(
+                modid, mod_storage_dir, mod_platform
+            )
+        except (OSError, struct.error):
+            sizes[modid] = 0
+    todo.sort(key=sizes.get, reverse=True)
+
+    def buffered_job(modid):
+        lines = []
+        return job(modid, lines.append), lines
+
+    failed = 0
+    with ThreadPoolExecutor(jobs) as pool:
+        for fut in as_completed([pool.submit(buffered_job, m) for m in todo]):
+            ok, lines = fut.result()
+            failed += not ok
+            print("\n".join(lines), flush=True)
+    return 0 if failed == 0 else 1
+
+
+InstallJob = collections.namedtuple("InstallJob", (
+    "srcpath",      # file in the storage dir
+    "dstpath",      # file in the install dir
+    "size",         # size of srcpath
+    "compressed",   # true if srcpath is a .uasset.z to decompress
+    "expected_size" # uncompressed size from the .uncompressed_size sidecar
+))
+
+
+def read_uncompressed_size(path: str):
+    """
+    Reads the .uasset.z.uncompressed_size sidecar for a .uasset.z file.
+
+    :returns: the size, or None if there's no sidecar
+    :raises uassetz.InconsistencyError: if the sidecar isn't a number
+    """
+    try:
+        with open(path + ".uncompressed_size", "rb") as sidecar:
+            text = sidecar.read(64)
+    except FileNotFoundError:
+        return None
+    try:
+        return int(text.strip(b"\x00 \t\r\n"))
+    except ValueError as exc:
+        raise uassetz.InconsistencyError(
+            "bad uncompressed_size file for " + path
+        ) from exc
+
+
+def plan_mod_install(storage_path: str, install_path: str) -> Tuple[List[str], List[InstallJob]]:
+    """
+    Walks a mod's storage dir, and works out what needs to be done to install
+    it to install_path.
+
+    :returns: directories to create (parents first), and files to install
+    """
+    dirs = []
+    jobs = []
     for sdir_path, dirnames, filenames in os.walk(
         storage_path,
         followlinks=True
     ):
-        idir_path = join(install_path, relpath(sdir_path, storage_path))
-        
+        idir_path = normpath(join(install_path, relpath(sdir_path, storage_path)))
+
         for dirname in dirnames:
-            os.mkdir(join(idir_path, dirname))
+            dirs.append(join(idir_path, dirname))
         for filename in filenames:
             if filename.endswith(".uasset.z.uncompressed_size"):
                 continue
-            slcidx = -2 if filename.endswith(".uasset.z") else None
+            compressed = filename.endswith(".uasset.z")
+            slcidx = -2 if compressed else None
             srcpath = join(sdir_path, filename)
             dstpath = join(idir_path, filename[:slcidx])
-            with open(srcpath, "rb") as src, open(dstpath, "wb") as dst:
-                if filename.endswith(".uasset.z"):
-                    uassetz.decompress(src, dst)
-                else:
-                    dst.write(src.read())
+            jobs.append(InstallJob(
+                srcpath, dstpath, os.stat(srcpath).st_size, compressed,
+                read_uncompressed_size(srcpath) if compressed else None
+            ))
+    return dirs, jobs
+
+
+def install_file(job: InstallJob, workers: int=1, executor=None, store=None):
+    start = time.perf_counter()
+    if store is not None:
+        store.install(job, workers, executor)
+    elif job.compressed:
+        uassetz.decompress_file(
+            job.srcpath, job.dstpath, workers, executor=executor,
+            expected_size=job.expected_size
+        )
+    else:
+        with stats.collector.phase("copy"):
+            fsutil.copy_file(job.srcpath, job.dstpath)
+
+    if stats.collector.enabled:
+        size = os.stat(job.dstpath).st_size
+        stats.collector.count("bytes_read", job.size)
+        stats.collector.count("bytes_written", size)
+        stats.collector.file_done(
+            job.dstpath, time.perf_counter() - start, size
+        )
+
+
+def run_install_jobs(jobs: List[InstallJob], workers: int=1, store=None):
+    """
+    Installs files. With more than one worker, this is a pipeline:
+    up to workers files are read and written at once on one pool of threads,
+    while their chunks are inflated on a second pool shared between them,
+    so neither the disk nor zlib has to wait for the other.
+    Big files are started first so they don't hold up the end of the run.
+
+    If store is given, files are added to it and hardlinked into place.
+    """
+    if workers <= 1:
+        for job in jobs:
+            install_file(job, store=store)
+        return
 
+    jobs = sorted(jobs, key=lambda job: job.size, reverse=True)
+    with ThreadPoolExecutor(workers) as inflate_pool, \
+            ThreadPoolExecutor(workers) as io_pool:
+        for _ in io_pool.map(
+            lambda job: install_file(job, workers, inflate_pool, store), jobs
+        ):
+            pass
+
+
+def write_modfile(modid: str, install_path: str):
     mip = join(install_path, "mod.info")
     with open(mip, "rb") as mif:
         mi = mif.read()
@@ -152,7 +375,100 @@ def do_mod_install(modid: str, mod_storage_dir: str, mod_platform: str):
     mf = mod.ark_gen_modfile(modid, mi, mmi)
     with open(install_path + ".mod", "wb") as modf:
         modf.write(mf)
-    print("installed {0}".format(modid))
+
+
+def fan_out_mod(modid: str, roots: List[str], replace: bool=False, log=print):
+    """
+    Mirrors the mod installed in the current ARK root into other ARK roots
+    (absolute paths). Files are hardlinked, or copied (reflinked, where the
+    filesystem can) if a root is on another filesystem, and each root gets
+    its own .mod file.
+
+    :param replace: replace a root's existing copy of the mod, rather than
+                    leaving it alone
+    """
+    modpath = join(mod.MOD_LOCATION, modid)
+    for root in roots:
+        target = join(root, mod.MOD_LOCATION, modid)
+        if not replace and exists(target + ".mod"):
+            continue
+        with stats.collector.phase("fanout"):
+            if isdir(target + ".new"):
+                recrm(target + ".new")
+            objstore.link_tree(modpath, target + ".new")
+            if isdir(target):
+                os.rename(target, target + ".old")
+            os.rename(target + ".new", target)
+            write_modfile(modid, target)
+            if isdir(target + ".old"):
+                recrm(target + ".old")
+        log("linked {0} into {1}".format(modid, root))
+
+
+def fanned_out(func, roots: List[str], replace: bool=False):
+    """Wraps a run_mod_jobs() func to fan each mod out to roots afterwards."""
+    if len(roots) == 0:
+        return func
+
+    def wrapper(modid, mod_storage_dir, mod_platform, log=print, **kwargs):
+        func(modid, mod_storage_dir, mod_platform, log=log, **kwargs)
+        fan_out_mod(modid, roots, replace, log)
+    return wrapper
+
+
+# Each install dir gets a manifest of the storage files it was built from,
+# so upgrades can tell which files have changed.
+MANIFEST_NAME = ".monark-manifest"
+
+
+def manifest_entry(job: InstallJob, st: os.stat_result=None) -> list:
+    if st is None:
+        st = os.stat(job.srcpath)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_manifest(install_path: str) -> dict:
+    try:
+        with open(join(install_path, MANIFEST_NAME), "rt") as mf:
+            return json.load(mf)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(install_path: str, files: dict):
+    mfp = join(install_path, MANIFEST_NAME)
+    with open(mfp + ".atom", "wt") as mf:
+        json.dump(files, mf)
+    os.replace(mfp + ".atom", mfp)
+
+
+def do_mod_install(modid: str, mod_storage_dir: str, mod_platform: str,
+                   workers: int=1, store=None, log=print,
+                   mods_dir: str=mod.MOD_LOCATION):
+    storage_path = join(mod_storage_dir, modid, mod_platform)
+    install_path = join(mods_dir, modid)
+
+    if exists(install_path + ".mod"):
+        log("mod {0} already installed.".format(modid))
+        return
+
+    with stats.collector.phase("plan"):
+        dirs, jobs = plan_mod_install(storage_path, install_path)
+    with stats.collector.phase("mkdir"):
+        os.mkdir(install_path)
+        for dirpath in dirs:
+            os.mkdir(dirpath)
+    run_install_jobs(jobs, workers, store)
+
+    with stats.collector.phase("modfile"):
+        write_modfile(modid, install_path)
+    with stats.collector.phase("manifest"):
+        write_manifest(install_path, {
+            relpath(job.srcpath, storage_path): manifest_entry(job)
+            for job in jobs
+        })
+    stats.collector.count("mods")
+    log("installed {0}".format(modid))
 
 
 def mod_install(args):
@@ -160,21 +476,180 @@ def mod_install(args):
         print("no modids specified!")
         return 1
 
-    for modid in args.modid:
-        if modid in OVERRIDE_MODIDS:
-            print("ignoring special modid %s" % modid)
+    if not args.force:
+        # Better to fail now than with half the mods installed.
+        with stats.collector.phase("preflight"):
+            plans = plan_mods(
+                args.modid, args.mod_storage_dir, args.mod_platform
+            )
+            ok, needed, free = check_free_space(plans)
+        if not ok:
+            print("not enough free space: {0:.1f} MiB needed, {1:.1f} MiB "
+                  "free (use --force to try anyway)".format(
+                      needed / 0x100000, free / 0x100000
+                  ))
+            return 1
+
+    return run_mod_jobs(
+        "install", fanned_out(do_mod_install, args.extra_roots),
+        args.modid, args.jobs,
+        args.mod_storage_dir, args.mod_platform,
+        workers=args.workers, store=open_store(args)
+    )
+
+
+# Install planning ###########################################################
+
+def free_space(path: str) -> Tuple[int, int]:
+    """:returns: bytes available to us on path's filesystem, and block size"""
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize, st.f_frsize
+
+
+def measure_inflate_rate(path: str, n_chunks: int=4) -> float:
+    """
+    Times inflating the first few chunks of a .uasset.z.
+
+    :returns: uncompressed bytes per second, for one thread
+    """
+    with open(path, "rb") as src:
+        _, chunk_headers = uassetz.read_chunk_table(src)
+        samples = [
+            (src.read(ch.chunk_compressed_size), ch.chunk_uncompressed_size)
+            for ch in chunk_headers[:n_chunks]
+        ]
+    start = time.perf_counter()
+    size = sum(len(uassetz._inflate_chunk(*sample)) for sample in samples)
+    seconds = time.perf_counter() - start
+    return size / seconds if seconds > 0 else 0.0
+
+
+def plan_mods(modids: List[str], mod_storage_dir: str, mod_platform: str,
+              n_largest: int=5) -> dict:
+    """
+    Plans the installation of mods that aren't installed yet.
+
+    :returns: modid -> ModSizePlan, or the error planning it hit
+    """
+    todo = [
+        modid for modid in modids
+        if modid not in OVERRIDE_MODIDS
+        and not exists(join(mod.MOD_LOCATION, modid + ".mod"))
+    ]
+    _, block_size = free_space(mod.MOD_LOCATION)
+
+    def plan(modid):
+        if not isdir(join(mod_storage_dir, modid, mod_platform)):
+            return FileNotFoundError("mod {0} isn't downloaded".format(modid))
+        try:
+            return plan_mod_size(
+                modid, mod_storage_dir, mod_platform, block_size, n_largest
+            )
+        except (OSError, struct.error) as err:
+            return err
+
+    with ThreadPoolExecutor(8) as pool:
+        return dict(zip(todo, pool.map(plan, todo)))
+
+
+def check_free_space(plans: dict) -> Tuple[bool, int, int]:
+    """:returns: whether plans fit on the disk, bytes needed, bytes free"""
+    needed = sum(
+        p.disk_size for p in plans.values() if isinstance(p, ModSizePlan)
+    )
+    free, _ = free_space(mod.MOD_LOCATION)
+    return needed <= free, needed, free
+
+
+def mod_plan(args):
+    if len(args.modid) == 0:
+        print("no modids specified!")
+        return 1
+
+    plans = plan_mods(
+        args.modid, args.mod_storage_dir, args.mod_platform, args.largest
+    )
+    ok, needed, free = check_free_space(plans)
+    good = {m: p for m, p in plans.items() if isinstance(p, ModSizePlan)}
+
+    largest = heapq.nlargest(
+        args.largest, (f for p in good.values() for f in p.largest)
+    )
+    # Time the biggest .uasset.z that can actually be read; any that can't
+    # are probably corrupt downloads, and are reported as such.
+    rate = 0.0
+    bad_samples = []
+    for _, path in largest:
+        if not path.endswith(".uasset.z"):
             continue
-        do_mod_install(modid, args.mod_storage_dir, args.mod_platform)
+        try:
+            rate = measure_inflate_rate(path)
+            break
+        except (OSError, struct.error, uassetz.UassetZError) as err:
+            bad_samples.append({
+                "path": path, "error": "{0}: {1}".format(type(err).__name__, err)
+            })
+    inflate_total = sum(p.inflate_size for p in good.values())
+    seconds = inflate_total / (rate * args.workers) if rate > 0 else None
+
+    report = {
+        "mods": {
+            modid: p._asdict() if isinstance(p, ModSizePlan) else {"error": str(p)}
+            for modid, p in plans.items()
+        },
+        "largest": [{"size": size, "path": path} for size, path in largest],
+        "bad_files": bad_samples,
+        "needed": needed,
+        "free": free,
+        "fits": ok,
+        "inflate_bytes_per_second": rate,
+        "estimated_seconds": seconds
+    }
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0 if ok and len(good) == len(plans) and not bad_samples else 1
+
+    skipped = [m for m in args.modid if m not in plans]
+    if len(skipped) > 0:
+        print("already installed or ignored: {0}".format(" ".join(skipped)))
+    for modid, p in plans.items():
+        if not isinstance(p, ModSizePlan):
+            print("{0}: error: {1}".format(modid, p))
+            continue
+        print("{0}: {1} files ({2} compressed), {3:.1f} MiB".format(
+            modid, p.files, p.compressed, p.size / 0x100000
+        ))
+    if len(largest) > 0:
+        print("largest files:")
+        for size, path in largest:
+            print("  {0:10.1f} MiB  {1}".format(size / 0x100000, path))
+    print("total: {0:.1f} MiB needed, {1:.1f} MiB free".format(
+        needed / 0x100000, free / 0x100000
+    ))
+    for bad in bad_samples:
+        print("bad file {0}: {1}".format(bad["path"], bad["error"]))
+    if seconds is not None:
+        print("estimated {0:.1f}s to decompress with {1} workers "
+              "({2:.1f} MiB/s per worker)".format(
+                  seconds, args.workers, rate / 0x100000
+              ))
+    if not ok:
+        print("not enough free space!")
+        return 1
+    return 0 if len(good) == len(plans) and not bad_samples else 1
 
 
 # Mod removal ################################################################
 
-def do_mod_remove(modid: str):
+def do_mod_remove(modid: str, workers: int=1, trash: bool=False):
     instpath = join(mod.MOD_LOCATION, modid)
     if os.path.exists(instpath + ".mod"):
         rm(instpath + ".mod")
     if os.path.isdir(instpath):
-        recrm(instpath)
+        with stats.collector.phase("remove"):
+            remove_tree(instpath, workers, trash)
+    stats.collector.count("mods")
 
 
 def mod_remove(args):
@@ -186,7 +661,10 @@ def mod_remove(args):
         if modid in OVERRIDE_MODIDS:
             print("ignoring special modid %s" % modid)
             continue
-        do_mod_remove(modid)
+        do_mod_remove(modid, args.workers, args.trash)
+        for root in args.extra_roots:
+            with ctxchdir(root):
+                do_mod_remove(modid, args.workers, args.trash)
 
     return 0
 
@@ -194,76 +672,573 @@ def mod_remove(args):
 # Mod upgrading ##############################################################
 
 def mod_chsuffix(modid: str, cursfx: str="", tarsfx: str=""):
-    with ctxchdir(mod.MOD_LOCATION):
-        if exists(modid + ".mod" + cursfx):
-            os.rename(modid + ".mod" + cursfx, modid + ".mod" + tarsfx)
-        os.rename(modid + cursfx, modid + tarsfx)
-
-def do_mod_upgrade(modid: str, mod_storage_dir: str, mod_platform: str):
-    print("renaming old mod files...")
-    mod_chsuffix(modid, tarsfx=".bak")
-    print("installing mod...")
-    do_mod_install(modid, mod_storage_dir, mod_platform)
-
-
-def mod_upgrade(args):
+    # No chdir here: mods may be upgraded from several threads at once.
+    modpath = join(mod.MOD_LOCATION, modid)
+    if exists(modpath + ".mod" + cursfx):
+        os.rename(modpath + ".mod" + cursfx, modpath + ".mod" + tarsfx)
+    os.rename(modpath + cursfx, modpath + tarsfx)
+
+
+def remove_snapshot(modid: str, tarsfx: str=".bak"):
+    modpath = join(mod.MOD_LOCATION, modid)
+    if isdir(modpath + tarsfx):
+        remove_tree(modpath + tarsfx, trash=True)
+    if exists(modpath + ".mod" + tarsfx):
+        rm(modpath + ".mod" + tarsfx)
+
+
+def mod_snapshot(modid: str, tarsfx: str=".bak"):
+    """
+    Replaces the mod's snapshot with a hardlinked copy of the installed mod.
+    Upgrades never write through existing files, so this stays intact.
+    """
+    modpath = join(mod.MOD_LOCATION, modid)
+    remove_snapshot(modid, tarsfx)
+    objstore.link_tree(modpath, modpath + tarsfx)
+    if exists(modpath + ".mod"):
+        shutil.copyfile(modpath + ".mod", modpath + ".mod" + tarsfx)
+
+
+def do_mod_rollback(modid: str, log=print):
+    modpath = join(mod.MOD_LOCATION, modid)
+    if not isdir(modpath + ".bak"):
+        log("mod {0} has no snapshot to roll back to.".format(modid))
+        return False
+    if isdir(modpath):
+        mod_chsuffix(modid, tarsfx=".old")
+    mod_chsuffix(modid, cursfx=".bak")
+    if isdir(modpath + ".old"):
+        remove_tree(modpath + ".old", trash=True)
+    if exists(modpath + ".mod.old"):
+        rm(modpath + ".mod.old")
+    log("rolled back {0}".format(modid))
+    return True
+
+
+def mod_rollback(args):
     if len(args.modid) == 0:
         print("no modids specified!")
         return 1
 
+    failed = 0
     for modid in args.modid:
         if modid in OVERRIDE_MODIDS:
             print("ignoring special modid %s" % modid)
             continue
-        do_mod_upgrade(modid, args.mod_storage_dir, args.mod_platform)
+        if do_mod_rollback(modid):
+            fan_out_mod(modid, args.extra_roots, replace=True)
+        else:
+            failed += 1
+
+    return 0 if failed == 0 else 1
 
+
+def mod_gc(args):
+    count, size = objstore.ObjectStore().gc()
+    print("removed {0} unreferenced objects ({1} bytes)".format(count, size))
     return 0
 
+def expected_install_size(job: InstallJob) -> int:
+    if job.compressed:
+        with open(job.srcpath, "rb") as src:
+            return uassetz.read_main_header(src).uncompressed_total
+    return job.size
 
-# Mod listing ################################################################
 
-def mod_list(args):
-    class ModEntry:
-        __slots__ = ["storage_dir", "install_dir"]
-        def __init__(self):
-            self.storage_dir = None
-            self.install_dir = None
-
-    def modinfo_strings(path: str, statsym: str):
-        if path is None:
-            return " ", None
+def job_unchanged(job: InstallJob, st: os.stat_result, old_entry, new_entry: list) -> bool:
+    """
+    Decides whether a previously installed file is still up to date.
+    Any change to the source's size or mtime counts as a change: a chunk
+    table can stay the same through an edit, so it proves nothing.
+    """
+    try:
+        dst_st = os.stat(job.dstpath)
+    except FileNotFoundError:
+        return False
+
+    if old_entry is None:
+        # Installed before manifests existed, go by sizes and times.
+        return dst_st.st_size == expected_install_size(job) and \
+            dst_st.st_mtime_ns >= st.st_mtime_ns
+
+    # Manifests used to carry a third, chunk table fingerprint, field.
+    return list(old_entry[:2]) == new_entry
+
+
+UPGRADE_SUFFIX = ".monark-new"
+
+
+def do_mod_upgrade_incremental(modid: str, mod_storage_dir: str,
+                               mod_platform: str, workers: int=1,
+                               store=None, log=print,
+                               mods_dir: str=mod.MOD_LOCATION):
+    storage_path = join(mod_storage_dir, modid, mod_platform)
+    install_path = join(mods_dir, modid)
+
+    if not isdir(install_path):
+        do_mod_install(
+            modid, mod_storage_dir, mod_platform, workers, store, log=log,
+            mods_dir=mods_dir
+        )
+        return
+
+    with stats.collector.phase("plan"):
+        dirs, jobs = plan_mod_install(storage_path, install_path)
+    old_manifest = read_manifest(install_path)
+    new_manifest = {}
+    changed = []
+    for job in jobs:
+        rel = relpath(job.srcpath, storage_path)
+        st = os.stat(job.srcpath)
+        new_entry = manifest_entry(job, st)
+        if not job_unchanged(job, st, old_manifest.get(rel), new_entry):
+            changed.append(job)
+        new_manifest[rel] = new_entry
+
+    for dirpath in dirs:
+        os.makedirs(dirpath, exist_ok=True)
+    # Changed files are written under another name, then renamed over the
+    # old ones once they have all been written. So a failed upgrade leaves
+    # the installed mod as it was, and nothing is written through an
+    # existing file (it may be hardlinked into a snapshot or the store).
+    new_jobs = [job._replace(dstpath=job.dstpath + UPGRADE_SUFFIX) for job in changed]
+    # Leftovers from an interrupted upgrade may be linked to store objects.
+    for job in new_jobs:
+        if exists(job.dstpath):
+            os.unlink(job.dstpath)
+    try:
+        run_install_jobs(new_jobs, workers, store)
+    except BaseException:
+        for job in new_jobs:
+            if exists(job.dstpath):
+                os.unlink(job.dstpath)
+        raise
+    for job in new_jobs:
+        os.replace(job.dstpath, job.dstpath[:-len(UPGRADE_SUFFIX)])
+
+    # Remove whatever is no longer in the storage tree.
+    keep_files = {job.dstpath for job in jobs}
+    keep_files.add(join(install_path, MANIFEST_NAME))
+    keep_dirs = set(dirs)
+    removed = 0
+    for idir_path, dirnames, filenames in os.walk(install_path, topdown=False):
+        for filename in filenames:
+            filepath = join(idir_path, filename)
+            if filepath not in keep_files:
+                os.unlink(filepath)
+                removed += 1
+        for dirname in dirnames:
+            dirpath = join(idir_path, dirname)
+            if dirpath not in keep_dirs and not os.path.islink(dirpath):
+                os.rmdir(dirpath)
+
+    write_modfile(modid, install_path)
+    write_manifest(install_path, new_manifest)
+    log("upgraded {0}: {1} of {2} files updated, {3} removed".format(
+        modid, len(changed), len(jobs), removed
+    ))
+
+
+def do_mod_upgrade(modid: str, mod_storage_dir: str, mod_platform: str,
+                   workers: int=1, full: bool=False, store=None, log=print):
+    if not full:
+        if store is not None and isdir(join(mod.MOD_LOCATION, modid)):
+            log("snapshotting mod {0}...".format(modid))
+            mod_snapshot(modid)
+        do_mod_upgrade_incremental(
+            modid, mod_storage_dir, mod_platform, workers, store, log=log
+        )
+        return
+    log("renaming old mod {0} files...".format(modid))
+    remove_snapshot(modid)
+    if isdir(join(mod.MOD_LOCATION, modid)):
+        mod_chsuffix(modid, tarsfx=".bak")
+    log("installing mod {0}...".format(modid))
+    do_mod_install(
+        modid, mod_storage_dir, mod_platform, workers, store, log=log
+    )
+
+
+def mod_upgrade(args):
+    if len(args.modid) == 0:
+        print("no modids specified!")
+        return 1
+
+    return run_mod_jobs(
+        "upgrade", fanned_out(do_mod_upgrade, args.extra_roots, replace=True),
+        args.modid, args.jobs,
+        args.mod_storage_dir, args.mod_platform,
+        workers=args.workers, full=args.full, store=open_store(args)
+    )
+
+
+def mod_watch(args):
+    """
+    Watches the storage dir, and upgrades installed mods (or just the given
+    modids) as soon as Steam has finished updating them.
+    """
+    store = open_store(args)
+    only = set(args.modid)
+
+    def on_settled(modid):
+        if len(only) > 0 and modid not in only:
+            return
+        if not isdir(join(args.mod_storage_dir, modid)):
+            return  # deleted.
+        if len(only) == 0 and not isdir(join(mod.MOD_LOCATION, modid)):
+            return  # not installed.
+        print("mod {0} changed, upgrading...".format(modid), flush=True)
+        run_mod_jobs(
+            "upgrade",
+            fanned_out(do_mod_upgrade, args.extra_roots, replace=True),
+            [modid], 1,
+            args.mod_storage_dir, args.mod_platform,
+            workers=args.workers, store=store
+        )
+
+    watcher = watch.open_watcher(args.mod_storage_dir, args.poll, args.interval)
+    print("watching {0}...".format(args.mod_storage_dir), flush=True)
+    try:
+        watch.watch(watcher, args.mod_storage_dir, on_settled, args.settle)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+# Staged installs ############################################################
+# "stage" does the slow part (decompressing) in a staging dir next to the
+# installed mods, while the server carries on running; "commit" then swaps the
+# staged mods in with a couple of renames each.
+
+STAGING_LOCATION = join(mod.MOD_LOCATION, ".monark-staging")
+
+
+def do_mod_stage(modid: str, mod_storage_dir: str, mod_platform: str,
+                 workers: int=1, full: bool=False, store=None, log=print):
+    """
+    Stages the current version of a mod. Unless full is set, an installed mod
+    is hardlinked into the staging dir and upgraded there incrementally;
+    upgrades never write through existing files, so the installed mod is
+    left as it was.
+    """
+    staged_path = join(STAGING_LOCATION, modid)
+    if isdir(staged_path):
+        recrm(staged_path)
+    if exists(staged_path + ".mod"):
+        rm(staged_path + ".mod")
+    os.makedirs(STAGING_LOCATION, exist_ok=True)
+
+    install_path = join(mod.MOD_LOCATION, modid)
+    if not full and isdir(install_path):
+        with stats.collector.phase("link"):
+            objstore.link_tree(install_path, staged_path)
+    do_mod_upgrade_incremental(
+        modid, mod_storage_dir, mod_platform, workers, store, log=log,
+        mods_dir=STAGING_LOCATION
+    )
+    log("staged {0}".format(modid))
+
+
+def mod_stage(args):
+    if len(args.modid) == 0:
+        print("no modids specified!")
+        return 1
+
+    ret = run_mod_jobs(
+        "stage", do_mod_stage, args.modid, args.jobs,
+        args.mod_storage_dir, args.mod_platform,
+        workers=args.workers, full=args.full, store=open_store(args)
+    )
+    if isdir(STAGING_LOCATION):
+        # One flush for everything staged, so commit has nothing left to wait
+        # on but the renames.
+        with stats.collector.phase("sync"):
+            fsutil.syncfs(STAGING_LOCATION)
+    return ret
+
+
+def do_mod_commit(modid: str, log=print) -> bool:
+    """
+    Swaps a staged mod in. The mod it replaces becomes the mod's snapshot,
+    so "rollback" undoes a commit.
+    """
+    staged_path = join(STAGING_LOCATION, modid)
+    if not isdir(staged_path) or not exists(staged_path + ".mod"):
+        log("mod {0} isn't staged.".format(modid))
+        return False
+
+    modpath = join(mod.MOD_LOCATION, modid)
+    remove_snapshot(modid)
+    if isdir(modpath):
+        mod_chsuffix(modid, tarsfx=".bak")
+    os.rename(staged_path, modpath)
+    os.rename(staged_path + ".mod", modpath + ".mod")
+    stats.collector.count("mods")
+    log("committed {0}".format(modid))
+    return True
+
+
+def mod_commit(args):
+    if len(args.modid) > 0:
+        modids = args.modid
+    elif isdir(STAGING_LOCATION):
+        modids = sorted(
+            (m for m in os.listdir(STAGING_LOCATION) if m.isnumeric()),
+            key=int
+        )
+    else:
+        modids = []
+
+    failed = 0
+    for modid in modids:
         try:
-            with open(join(path, "mod.info"), "rb") as mif:
-                mi = mod.ark_unpack_mod_info(mif.read())
-            return statsym, mi.mod_name.decode("utf8")
-        except (IOError, struct.error) as err:
-            print("error: " + str(err), file=sys.stderr)
-            return "!", None
+            if do_mod_commit(modid):
+                fan_out_mod(modid, args.extra_roots, replace=True)
+            else:
+                failed += 1
+        except OSError as err:
+            print("failed to commit {0}: {1}".format(modid, err))
+            failed += 1
+    if len(modids) > 0:
+        fsutil.fsync_dir(mod.MOD_LOCATION)
+
+    return 0 if failed == 0 else 1
+
+
+# Mod packing ################################################################
+
+# Files with these suffixes are stored compressed (as .uasset.z etc.)
+PACK_COMPRESS_SUFFIXES = (".uasset",)
+
+PackJob = collections.namedtuple("PackJob", (
+    "srcpath",      # file in the working mod tree
+    "dstpath",      # file in the workshop layout
+    "size",         # size of srcpath
+    "compress"      # true if srcpath is to be compressed to a .uasset.z
+))
+
+
+def plan_mod_pack(source_path: str, dest_path: str) -> Tuple[List[str], List[PackJob], int]:
+    """
+    Walks a working mod tree, and works out what needs to be done to pack it
+    into dest_path. Files whose output is already newer than them are skipped.
+
+    :returns: directories to create (parents first), files to pack, and the
+              number of files skipped
+    """
+    dirs = []
+    jobs = []
+    skipped = 0
+    for sdir_path, dirnames, filenames in os.walk(
+        source_path,
+        followlinks=True
+    ):
+        ddir_path = normpath(join(dest_path, relpath(sdir_path, source_path)))
 
-    mods = collections.defaultdict(ModEntry)
-    if isdir(args.mod_storage_dir):
-        for modid in os.listdir(args.mod_storage_dir):
-            if not modid.isnumeric():
-                continue
-            if len(args.modid) > 0 and modid not in args.modid:
+        for dirname in dirnames:
+            dirs.append(join(ddir_path, dirname))
+        for filename in filenames:
+            # Not part of the mod: monark's own bookkeeping, and leftovers
+            # from an interrupted pack into the same tree.
+            if filename == MANIFEST_NAME or filename.endswith(".atom"):
                 continue
+            compress = filename.endswith(PACK_COMPRESS_SUFFIXES)
+            srcpath = join(sdir_path, filename)
+            dstpath = join(ddir_path, filename + (".z" if compress else ""))
+            st = os.stat(srcpath)
+            try:
+                if os.stat(dstpath).st_mtime_ns > st.st_mtime_ns and \
+                        (not compress or exists(dstpath + ".uncompressed_size")):
+                    skipped += 1
+                    continue
+            except FileNotFoundError:
+                pass
+            jobs.append(PackJob(srcpath, dstpath, st.st_size, compress))
+    return dirs, jobs, skipped
+
+
+def pack_file(job: PackJob, workers: int=1, executor=None):
+    # Outputs are written under another name and moved into place, so an
+    # interrupted pack never leaves a partial file that looks up to date.
+    start = time.perf_counter()
+    if job.compress:
+        # The previous output, if any, lets unchanged chunks be reused.
+        try:
+            reference = open(job.dstpath, "rb")
+        except FileNotFoundError:
+            reference = None
+        try:
+            with open(job.srcpath, "rb") as src, \
+                    open(job.dstpath + ".atom", "wb") as dst:
+                uassetz.compress(
+                    src, dst, workers=workers, executor=executor,
+                    reference=reference
+                )
+                size = src.tell()
+        finally:
+            if reference is not None:
+                reference.close()
+        with open(job.dstpath + ".uncompressed_size", "wt") as sidecar:
+            sidecar.write(str(size))
+    else:
+        with stats.collector.phase("copy"):
+            fsutil.copy_file(job.srcpath, job.dstpath + ".atom")
+    os.replace(job.dstpath + ".atom", job.dstpath)
+
+    if stats.collector.enabled:
+        stats.collector.count("bytes_read", job.size)
+        stats.collector.count("bytes_written", os.stat(job.dstpath).st_size)
+        stats.collector.file_done(
+            job.dstpath, time.perf_counter() - start, job.size
+        )
+
+
+def run_pack_jobs(jobs: List[PackJob], workers: int=1):
+    """
+    Packs files. As with run_install_jobs(), with more than one worker files
+    are read and written on one pool while chunks are deflated on another,
+    biggest files first.
+    """
+    if workers <= 1:
+        for job in jobs:
+            pack_file(job)
+        return
 
-            sdir = join(args.mod_storage_dir, modid)
-            if len(os.listdir(sdir)) == 0:
-                continue
+    jobs = sorted(jobs, key=lambda job: job.size, reverse=True)
+    with ThreadPoolExecutor(workers) as deflate_pool, \
+            ThreadPoolExecutor(workers) as io_pool:
+        for _ in io_pool.map(
+            lambda job: pack_file(job, workers, deflate_pool), jobs
+        ):
+            pass
 
-            mods[modid].storage_dir = sdir
 
-    if isdir(mod.MOD_LOCATION):
-        for modid in os.listdir(mod.MOD_LOCATION):
-            if not modid.isnumeric():
-                continue
-            if len(args.modid) > 0 and modid not in args.modid:
-                continue
+def mod_pack(args):
+    with stats.collector.phase("plan"):
+        dirs, jobs, skipped = plan_mod_pack(args.pack_source, args.pack_dest)
+    try:
+        with stats.collector.phase("mkdir"):
+            os.makedirs(args.pack_dest, exist_ok=True)
+            for dirpath in dirs:
+                os.makedirs(dirpath, exist_ok=True)
+        run_pack_jobs(jobs, args.workers)
+    except (OSError, uassetz.UassetZError) as err:
+        print("failed to pack {0}: {1}".format(args.pack_source, err))
+        return 1
+
+    print("packed {0} files ({1} compressed), {2} already up to date".format(
+        len(jobs), sum(job.compress for job in jobs), skipped
+    ))
+    return 0
+
+
+# Mod verification ###########################################################
+
+def verify_storage_file(path: str):
+    """:returns: None if path is fine, otherwise a description of the problem"""
+    try:
+        uassetz.verify_file(path)
+    except (OSError, uassetz.UassetZError) as err:
+        return "{0}: {1}".format(type(err).__name__, err)
+    return None
+
+
+def mod_verify(args):
+    if len(args.modid) > 0:
+        modids = args.modid
+    elif isdir(args.mod_storage_dir):
+        modids = sorted(
+            (m for m in os.listdir(args.mod_storage_dir) if m.isnumeric()),
+            key=int
+        )
+    else:
+        modids = []
 
-            mods[modid].install_dir = join(mod.MOD_LOCATION, modid)
+    paths = []
+    missing = []
+    for modid in modids:
+        storage_path = join(args.mod_storage_dir, modid, args.mod_platform)
+        if not isdir(storage_path):
+            missing.append((modid, storage_path))
+            continue
+        for sdir_path, dirnames, filenames in os.walk(
+            storage_path,
+            followlinks=True
+        ):
+            for filename in filenames:
+                if filename.endswith(".uasset.z"):
+                    paths.append((modid, join(sdir_path, filename)))
+
+    report = {
+        modid: {"files": 0, "bad": []}
+        for modid in modids
+    }
+    with ThreadPoolExecutor(max(args.jobs, 1)) as pool:
+        errors = pool.map(lambda p: verify_storage_file(p[1]), paths)
+        for (modid, path), error in zip(paths, errors):
+            report[modid]["files"] += 1
+            if error is not None:
+                report[modid]["bad"].append({"path": path, "error": error})
+    for modid, storage_path in missing:
+        report[modid]["bad"].append(
+            {"path": storage_path, "error": "not downloaded"}
+        )
+
+    n_bad = sum(len(r["bad"]) for r in report.values())
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        for modid in modids:
+            for bad in report[modid]["bad"]:
+                print("[{0}] {1}: {2}".format(modid, bad["path"], bad["error"]))
+        print("verified {0} files in {1} mods, {2} bad.".format(
+            len(paths), len(modids), n_bad
+        ))
+    return 0 if n_bad == 0 else 1
+
+
+# Mod listing ################################################################
+
+def mod_list(args):
+    def modinfo_strings(side: dict, statsym: str):
+        if side is None:
+            return " ", None
+        if side["error"] is not None:
+            print("error: " + side["error"], file=sys.stderr)
+            return "!", None
+        return statsym, side["name"]
+
+    cat = catalog.Catalog()
+    # Sizes are only shown in JSON, and take walking every mod's tree.
+    mods = cat.refresh(args.mod_storage_dir, sizes=args.json and args.sizes)
+    cat.save()
+
+    modids = sorted(
+        (modid for modid in mods if len(args.modid) == 0 or modid in args.modid),
+        key=int
+    )
+
+    if args.json:
+        def side_json(side: dict):
+            if side is None:
+                return None
+            return {k: v for k, v in side.items() if k != "stamp"}
+
+        json.dump([
+            {
+                "modid": modid,
+                "override_name": OVERRIDE_MODIDS.get(modid),
+                "storage": side_json(mods[modid]["storage"]),
+                "install": side_json(mods[modid]["install"])
+            }
+            for modid in modids
+        ], sys.stdout, indent=2)
+        print()
+        return 0
 
-    modids = sorted(mods.keys(), key=int)
     if len(modids) < 1:
         print("no mods to show.")
         return 0
@@ -272,8 +1247,8 @@ def mod_list(args):
     for modid in modids:
         ent = mods[modid]
         # output format: [di] <modid> name (downloded, installed)
-        sq, sname = modinfo_strings(ent.storage_dir, "s")
-        iq, iname = modinfo_strings(ent.install_dir, "i")
+        sq, sname = modinfo_strings(ent["storage"], "s")
+        iq, iname = modinfo_strings(ent["install"], "i")
 
         # name printing logic:
         # OVERRIDE_MODIDS? -> use that one.
@@ -303,29 +1278,88 @@ def mod_list(args):
 
 
 def tool_argparse(parser):
-    parser.add_argument("-r", "--ark-root", dest="ark_root", action="store", default="./")
+    parser.add_argument("-r", "--ark-root", dest="ark_root", action="append", default=None)
     parser.add_argument("-m", "--mod-storage", dest="mod_storage_dir", action="store", default=DEFAULT_MOD_STORAGE_DIR)
     parser.add_argument("-p", "--mod-platform", dest="mod_platform", action="store", choices={"LinuxNoEditor", "WindowsNoEditor"}, default=None)
-    parser.set_defaults(func=modtool, mod_func=mod_list, modid=[])
+    parser.add_argument("-s", "--store", dest="use_store", action="store_true", default=False)
+    parser.add_argument("--stats", dest="stats", action="store_true", default=False)
+    parser.add_argument("--stats-json", dest="stats_json", action="store", default=None)
+    parser.add_argument("--stats-prom", dest="stats_prom", action="store", default=None)
+    parser.set_defaults(func=modtool, mod_func=mod_list, modid=[], json=False, sizes=False, in_ark_root=True)
 
     spo = parser.add_subparsers()
 
     lstp = spo.add_parser("list", aliases=["ls"])
     lstp.add_argument(dest="modid", action="store", nargs="*")
+    lstp.add_argument("--json", dest="json", action="store_true", default=False)
+    lstp.add_argument("--sizes", dest="sizes", action="store_true", default=False)
     lstp.set_defaults(mod_func=mod_list)
 
     insp = spo.add_parser("install", aliases=["ins"])
     insp.add_argument(dest="modid", action="store", nargs="*")
+    insp.add_argument("-j", "--jobs", dest="jobs", action="store", type=int, default=1)
+    insp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    insp.add_argument("-f", "--force", dest="force", action="store_true", default=False)
     insp.set_defaults(mod_func=mod_install)
 
+    plnp = spo.add_parser("plan")
+    plnp.add_argument(dest="modid", action="store", nargs="*")
+    plnp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    plnp.add_argument("-n", "--largest", dest="largest", action="store", type=int, default=5)
+    plnp.add_argument("--json", dest="json", action="store_true", default=False)
+    plnp.set_defaults(mod_func=mod_plan)
+
     remp = spo.add_parser("remove", aliases=["rm"])
     remp.add_argument(dest="modid", action="store", nargs="*")
+    remp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    remp.add_argument("-t", "--trash", dest="trash", action="store_true", default=False)
     remp.set_defaults(mod_func=mod_remove)
 
     updp = spo.add_parser("upgrade", aliases=["up"])
     updp.add_argument(dest="modid", action="store", nargs="*")
+    updp.add_argument("-j", "--jobs", dest="jobs", action="store", type=int, default=1)
+    updp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    updp.add_argument("--full", dest="full", action="store_true", default=False)
     updp.set_defaults(mod_func=mod_upgrade)
 
+    verp = spo.add_parser("verify")
+    verp.add_argument(dest="modid", action="store", nargs="*")
+    verp.add_argument("-j", "--jobs", dest="jobs", action="store", type=int, default=1)
+    verp.add_argument("--json", dest="json", action="store_true", default=False)
+    verp.set_defaults(mod_func=mod_verify)
+
+    rbkp = spo.add_parser("rollback")
+    rbkp.add_argument(dest="modid", action="store", nargs="*")
+    rbkp.set_defaults(mod_func=mod_rollback)
+
+    watp = spo.add_parser("watch")
+    watp.add_argument(dest="modid", action="store", nargs="*")
+    watp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    watp.add_argument("--settle", dest="settle", action="store", type=float, default=30.0)
+    watp.add_argument("--poll", dest="poll", action="store_true", default=False)
+    watp.add_argument("--interval", dest="interval", action="store", type=float, default=10.0)
+    watp.set_defaults(mod_func=mod_watch)
+
+    stgp = spo.add_parser("stage")
+    stgp.add_argument(dest="modid", action="store", nargs="*")
+    stgp.add_argument("-j", "--jobs", dest="jobs", action="store", type=int, default=1)
+    stgp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    stgp.add_argument("--full", dest="full", action="store_true", default=False)
+    stgp.set_defaults(mod_func=mod_stage)
+
+    cmtp = spo.add_parser("commit")
+    cmtp.add_argument(dest="modid", action="store", nargs="*")
+    cmtp.set_defaults(mod_func=mod_commit)
+
+    pckp = spo.add_parser("pack")
+    pckp.add_argument(dest="pack_source", action="store")
+    pckp.add_argument(dest="pack_dest", action="store")
+    pckp.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=1)
+    pckp.set_defaults(mod_func=mod_pack, in_ark_root=False)
+
+    gcp = spo.add_parser("gc")
+    gcp.set_defaults(mod_func=mod_gc)
+
 
 def main():
     parser = argparse.ArgumentParser()
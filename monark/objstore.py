@@ -0,0 +1,150 @@
+"""
+Content-addressed store of installed mod files.
+
+Decompressed/copied mod files are kept under STORE_LOCATION (relative to the
+ARK root), named by the SHA-256 of their contents:
+  objects/<first 2 hex digits>/<remaining hex digits>
+
+Installed mod trees are built from hardlinks to these objects, so identical
+files across mods and mod versions are only stored once, and a snapshot of a
+mod is just another tree of hardlinks.
+An object whose link count has dropped to 1 is referenced only by the store,
+and can be garbage collected.
+"""
+
+import os
+import uuid
+import errno
+import hashlib
+
+from os.path import join, relpath, exists
+
+from typing import Tuple
+
+from . import fsutil
+from . import uassetz
+
+
+STORE_LOCATION = ".monark/objects"
+HASH_BUFFER_SIZE = 0x100000
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as src:
+        while True:
+            n = src.readinto(buf)
+            if n == 0:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+# errnos from link() that mean "copy instead": different filesystems, no
+# hardlink support, or too many links to one file.
+LINK_FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP
+}
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Hardlinks src to dst, or copies it where it can't be linked, replacing
+    whatever is at dst. An existing dst is never written through, as it may
+    be linked to a store object.
+    """
+    tmppath = "{0}.{1}.tmp".format(dst, uuid.uuid4().hex)
+    try:
+        try:
+            os.link(src, tmppath)
+        except OSError as err:
+            if err.errno not in LINK_FALLBACK_ERRNOS:
+                raise
+            fsutil.copy_file(src, tmppath)
+        os.replace(tmppath, dst)
+    except BaseException:
+        if exists(tmppath):
+            os.unlink(tmppath)
+        raise
+
+
+def link_tree(src: str, dst: str):
+    """Recreates the directory tree src at dst, hardlinking every file."""
+    os.mkdir(dst)
+    for dirpath, dirnames, filenames in os.walk(src):
+        ddir_path = join(dst, relpath(dirpath, src))
+        for dirname in dirnames:
+            os.mkdir(join(ddir_path, dirname))
+        for filename in filenames:
+            link_or_copy(join(dirpath, filename), join(ddir_path, filename))
+
+
+class ObjectStore:
+    def __init__(self, root: str=STORE_LOCATION):
+        self.root = root
+        self.tmpdir = join(root, "tmp")
+        os.makedirs(self.tmpdir, exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        return join(self.root, digest[:2], digest[2:])
+
+    def add(self, path: str) -> str:
+        """
+        Moves the file at path into the store, unless an identical object is
+        already there, in which case the file is removed.
+
+        :returns: the path of the object
+        """
+        objpath = self.object_path(hash_file(path))
+        if exists(objpath):
+            os.unlink(path)
+        else:
+            os.makedirs(os.path.dirname(objpath), exist_ok=True)
+            os.replace(path, objpath)
+        return objpath
+
+    def install(self, job, workers: int=1, executor=None):
+        """
+        Decompresses or copies an install job's source file into the store,
+        then hardlinks the resulting object to the job's destination.
+        """
+        # Not mkstemp: that makes files only we can read, but the server may
+        # not run as the user installing mods.
+        tmppath = join(self.tmpdir, uuid.uuid4().hex)
+        os.close(os.open(tmppath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        try:
+            if job.compressed:
+                uassetz.decompress_file(
+                    job.srcpath, tmppath, workers, executor=executor,
+                    expected_size=job.expected_size
+                )
+            else:
+                fsutil.copy_file(job.srcpath, tmppath)
+            objpath = self.add(tmppath)
+        except BaseException:
+            if exists(tmppath):
+                os.unlink(tmppath)
+            raise
+        link_or_copy(objpath, job.dstpath)
+
+    def gc(self) -> Tuple[int, int]:
+        """
+        Removes objects that are no longer linked from anywhere else.
+
+        :returns: number of objects removed, and their total size
+        """
+        count = 0
+        size = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.tmpdir:
+                continue
+            for filename in filenames:
+                objpath = join(dirpath, filename)
+                st = os.stat(objpath)
+                if st.st_nlink == 1:
+                    os.unlink(objpath)
+                    count += 1
+                    size += st.st_size
+        return count, size
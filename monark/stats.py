@@ -0,0 +1,192 @@
+"""
+Run statistics: per-phase timings, counters and the slowest files.
+
+Code being measured goes through the module level collector:
+    with stats.collector.phase("inflate"):
+        ...
+    stats.collector.count("chunks")
+By default, collector is a NullStats, which does nothing at all. enable()
+swaps in a real Stats collector.
+
+Phase times are summed over all threads, so with several workers a phase can
+take longer than the whole run.
+"""
+
+import os
+import json
+import time
+import heapq
+import threading
+import contextlib
+
+from typing import Dict
+
+
+class NullStats:
+    enabled = False
+
+    _null_phase = contextlib.nullcontext()
+
+    def phase(self, name: str):
+        return self._null_phase
+
+    def count(self, name: str, n: int=1):
+        pass
+
+    def file_done(self, path: str, seconds: float, size: int):
+        pass
+
+
+class _Phase:
+    __slots__ = ["stats", "name", "start"]
+
+    def __init__(self, stats, name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.stats.add_phase(self.name, time.perf_counter() - self.start)
+
+
+class Stats:
+    enabled = True
+
+    def __init__(self, n_slowest: int=10):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.start_perf = time.perf_counter()
+        self.phases = {}    # name -> [seconds, calls]
+        self.counters = {}
+        self.slowest = []   # min-heap of (seconds, path, size)
+        self.n_slowest = n_slowest
+
+    def phase(self, name: str):
+        return _Phase(self, name)
+
+    def add_phase(self, name: str, seconds: float):
+        with self.lock:
+            ent = self.phases.setdefault(name, [0.0, 0])
+            ent[0] += seconds
+            ent[1] += 1
+
+    def count(self, name: str, n: int=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def file_done(self, path: str, seconds: float, size: int):
+        with self.lock:
+            self.counters["files"] = self.counters.get("files", 0) + 1
+            item = (seconds, path, size)
+            if len(self.slowest) < self.n_slowest:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            wall = time.perf_counter() - self.start_perf
+            files = self.counters.get("files", 0)
+            return {
+                "start": self.start,
+                "wall_seconds": wall,
+                "files_per_second": files / wall if wall > 0 else 0.0,
+                "phases": {
+                    name: {"seconds": secs, "calls": calls}
+                    for name, (secs, calls) in self.phases.items()
+                },
+                "counters": dict(self.counters),
+                "slowest_files": [
+                    {"path": path, "seconds": secs, "size": size}
+                    for secs, path, size in sorted(self.slowest, reverse=True)
+                ]
+            }
+
+    def summary(self) -> str:
+        d = self.as_dict()
+        wall = d["wall_seconds"]
+        lines = ["--- stats: {0:.3f}s wall, {1:.1f} files/s".format(
+            wall, d["files_per_second"]
+        )]
+        for name, ent in sorted(d["phases"].items(), key=lambda i: -i[1]["seconds"]):
+            lines.append("  phase {0:<10} {1:10.3f}s  {2:8d} calls".format(
+                name, ent["seconds"], ent["calls"]
+            ))
+        for name, value in sorted(d["counters"].items()):
+            if name.startswith("bytes") and wall > 0:
+                lines.append("  {0:<16} {1:14d}  ({2:.1f} MB/s)".format(
+                    name, value, value / wall / 0x100000
+                ))
+            else:
+                lines.append("  {0:<16} {1:14d}".format(name, value))
+        if len(d["slowest_files"]) > 0:
+            lines.append("  slowest files:")
+            for ent in d["slowest_files"]:
+                lines.append("    {0:8.3f}s {1:12d} {2}".format(
+                    ent["seconds"], ent["size"], ent["path"]
+                ))
+        return "\n".join(lines)
+
+    def write_json(self, path: str):
+        _atomic_write(path, json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str, labels: Dict[str, str]=None):
+        """
+        Writes the stats in the Prometheus text format, for node_exporter's
+        textfile collector.
+        """
+        d = self.as_dict()
+        base = ",".join(
+            '{0}="{1}"'.format(k, v) for k, v in sorted((labels or {}).items())
+        )
+
+        def lbl(**extra):
+            parts = [base] if base else []
+            parts += ['{0}="{1}"'.format(k, v) for k, v in extra.items()]
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = [
+            "# TYPE monark_run_seconds gauge",
+            "monark_run_seconds{0} {1}".format(lbl(), d["wall_seconds"]),
+            "# TYPE monark_run_files_per_second gauge",
+            "monark_run_files_per_second{0} {1}".format(lbl(), d["files_per_second"]),
+            "# TYPE monark_run_timestamp_seconds gauge",
+            "monark_run_timestamp_seconds{0} {1}".format(lbl(), d["start"]),
+            "# TYPE monark_phase_seconds gauge",
+        ]
+        for name, ent in sorted(d["phases"].items()):
+            lines.append("monark_phase_seconds{0} {1}".format(
+                lbl(phase=name), ent["seconds"]
+            ))
+        lines.append("# TYPE monark_phase_calls gauge")
+        for name, ent in sorted(d["phases"].items()):
+            lines.append("monark_phase_calls{0} {1}".format(
+                lbl(phase=name), ent["calls"]
+            ))
+        for name, value in sorted(d["counters"].items()):
+            lines.append("# TYPE monark_{0} gauge".format(name))
+            lines.append("monark_{0}{1} {2}".format(name, lbl(), value))
+        _atomic_write(path, "\n".join(lines) + "\n")
+
+
+def _atomic_write(path: str, text: str):
+    # node_exporter may read the file at any time, so never leave it partial.
+    with open(path + ".atom", "wt") as out:
+        out.write(text)
+    os.replace(path + ".atom", path)
+
+
+collector = NullStats()
+
+
+def enable(n_slowest: int=10) -> Stats:
+    global collector
+    collector = Stats(n_slowest)
+    return collector
+
+
+def disable():
+    global collector
+    collector = NullStats()
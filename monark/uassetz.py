@@ -21,8 +21,19 @@ corresponding to the "compressed size" field in the chunk headers.
 
 import struct
 import zlib
+import os
+import stat
+import mmap
 import collections
+import bisect
 import io
+import shutil
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from . import stats
+from . import fsutil
 
 
 
@@ -44,6 +55,12 @@ class DecompressionError(UassetZError):
 
 UNREAL_MAGIC = b"\xc1\x83\x2a\x9e"  # 0x9e2a83c1 LE
 DEFAULT_CHUNK_SIZE = 0x20000        # All ARK mods seem to use this value.
+MAIN_HEADER_SIZE = 32
+CHUNK_HEADER_SIZE = 16
+# compress() spools output to disk past this size when dest can't seek.
+SPOOL_MAX_SIZE = 4 * DEFAULT_CHUNK_SIZE
+# Default UassetZReader chunk cache size.
+READER_CACHE_SIZE = 16 * DEFAULT_CHUNK_SIZE
 
 
 # Utility functions #########################################################
@@ -58,7 +75,7 @@ UassetZMainHeader = collections.namedtuple("UassetZMainHeader", (
 
 
 def read_main_header(source) -> UassetZMainHeader:
-    header = struct.unpack("<4sLQQQ", source.read(32))
+    header = struct.unpack("<4sLQQQ", source.read(MAIN_HEADER_SIZE))
     return UassetZMainHeader(*header)
 
 
@@ -73,7 +90,7 @@ UassetZChunkHeader = collections.namedtuple("UassetZChunkHeader", (
 
 
 def read_chunk_header(source) -> UassetZChunkHeader:
-    header = struct.unpack("<QQ", source.read(16))
+    header = struct.unpack("<QQ", source.read(CHUNK_HEADER_SIZE))
     return UassetZChunkHeader(*header)
 
 
@@ -81,21 +98,18 @@ def write_chunk_header(dest, header: UassetZChunkHeader):
     dest.write(struct.pack("<QQ", *header))
 
 
-# main functions ############################################################
-
-def decompress(source, dest):
+def read_chunk_table(source):
     """
-    Decompresses a compressed uasset (".uasset.z")
+    Reads and checks the main header and chunk headers of a compressed uasset.
+    On return, source is positioned at the start of the first chunk.
 
     :param source:  stream to read compressed data from
-    :param dest:    stream to write uncompressed data to
+    :returns: the main header, and a list of chunk headers
     :raises FormatVersionError: raised if the signature/version magic is wrong
     :raises InconsistencyError: raised if header values don't add up
-    :raises DecompressionError: rasied if there is any problem decompressing
     """
-
-    magic, ver, chunk_size, compressed_total, uncompressed_total = \
-        read_main_header(source)
+    main_header = read_main_header(source)
+    magic, ver, chunk_size, compressed_total, uncompressed_total = main_header
 
     if magic != UNREAL_MAGIC:
         raise FormatVersionError("unrecognised magic")
@@ -105,12 +119,11 @@ def decompress(source, dest):
     chunk_headers = []
     while compressed_total > 0 or uncompressed_total > 0:
 
-        chunk_compressed_size, chunk_uncompressed_size = \
-            read_chunk_header(source)
-        chunk_headers.append((chunk_compressed_size, chunk_uncompressed_size))
+        chunk_header = read_chunk_header(source)
+        chunk_headers.append(chunk_header)
 
-        compressed_total -= chunk_compressed_size
-        uncompressed_total -= chunk_uncompressed_size
+        compressed_total -= chunk_header.chunk_compressed_size
+        uncompressed_total -= chunk_header.chunk_uncompressed_size
 
     # sanity checks:
     if uncompressed_total != 0:
@@ -119,53 +132,365 @@ def decompress(source, dest):
     if compressed_total != 0:
         raise InconsistencyError("excess compressed data?")
 
-    for chunk_compressed_size, chunk_uncompressed_size in chunk_headers:
-        compressed_chunk = source.read(chunk_compressed_size)
-        if len(compressed_chunk) != chunk_compressed_size:
-            raise DecompressionError(
-                "truncated chunk"
-            )
-        try:
+    return main_header, chunk_headers
+
+
+# main functions ############################################################
+
+def _inflate_chunk(compressed_chunk, chunk_uncompressed_size: int) -> bytes:
+    try:
+        with stats.collector.phase("inflate"):
             chunk = zlib.decompress(compressed_chunk)
-        except zlib.error as exc:
-            raise DecompressionError("zlib chunk decompression error") from exc
-        if len(chunk) != chunk_uncompressed_size:
-            raise DecompressionError(
-                "uncompressed size of chunk does not match chunk header"
-            )
-        dest.write(chunk)
+    except zlib.error as exc:
+        raise DecompressionError("zlib chunk decompression error") from exc
+    stats.collector.count("chunks_inflated")
+    if len(chunk) != chunk_uncompressed_size:
+        raise DecompressionError(
+            "uncompressed size of chunk does not match chunk header"
+        )
+    return chunk
+
+
+def _ordered_map(func, arglists, workers: int, window: int=None,
+                 executor=None):
+    """
+    Like itertools.starmap, but calls func on a pool of worker threads.
+    Results are yielded in order, and at most window calls are in flight
+    (queued or running) at once, so arglists is consumed lazily.
+
+    If executor is given, calls are submitted to it instead of a private
+    pool of workers threads. It may be shared with other callers.
+    """
+    if executor is None:
+        if workers <= 1:
+            for args in arglists:
+                yield func(*args)
+            return
+        with ThreadPoolExecutor(workers) as pool:
+            yield from _ordered_map(func, arglists, workers, window, pool)
+        return
+
+    if window is None:
+        window = 2 * max(workers, 1)
+
+    pending = collections.deque()
+    try:
+        for args in arglists:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        # Calls may still reference the caller's buffers, so don't return
+        # until the ones already running are done.
+        for fut in pending:
+            fut.cancel()
+        wait(pending)
+
+
+def _check_expected_size(main_header: UassetZMainHeader, expected_size: int):
+    if expected_size is not None and \
+            expected_size != main_header.uncompressed_total:
+        raise InconsistencyError(
+            "uncompressed total does not match expected size"
+        )
+
+
+def _preallocate_stream(dest, size: int):
+    try:
+        fd = dest.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return
+        dest.flush()
+        fsutil.preallocate(fd, size, dest.tell())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+
+
+def decompress(source, dest, workers: int=1, executor=None,
+               expected_size: int=None):
+    """
+    Decompresses a compressed uasset (".uasset.z")
 
+    If dest is a regular file, space for the output is reserved up front.
 
-def compress(source, dest, chunk_size=DEFAULT_CHUNK_SIZE):
+    :param source:  stream to read compressed data from
+    :param dest:    stream to write uncompressed data to
+    :param workers: number of threads to decompress chunks with
+    :param executor: optional shared thread pool to decompress chunks on
+    :param expected_size: uncompressed size from elsewhere (e.g. the
+                          .uncompressed_size file), checked against the header
+    :raises FormatVersionError: raised if the signature/version magic is wrong
+    :raises InconsistencyError: raised if header values don't add up
+    :raises DecompressionError: rasied if there is any problem decompressing
     """
-    Compresses some data using "uasset.z" compression.
 
-    :param source:      stream to read uncompressed data from
-    :param dest:        stream to write compressed data to
-    :param chunk_size:  chunk size to use
+    main_header, chunk_headers = read_chunk_table(source)
+    _check_expected_size(main_header, expected_size)
+    _preallocate_stream(dest, main_header.uncompressed_total)
+
+    def compressed_chunks():
+        for chunk_compressed_size, chunk_uncompressed_size in chunk_headers:
+            with stats.collector.phase("read"):
+                compressed_chunk = source.read(chunk_compressed_size)
+            if len(compressed_chunk) != chunk_compressed_size:
+                raise DecompressionError(
+                    "truncated chunk"
+                )
+            yield compressed_chunk, chunk_uncompressed_size
+
+    for chunk in _ordered_map(
+        _inflate_chunk, compressed_chunks(), workers, executor=executor
+    ):
+        with stats.collector.phase("write"):
+            dest.write(chunk)
+
+
+def _inflate_into(src_view: memoryview, coffset: int, chunk_compressed_size: int,
+                  dest_map, uoffset: int, chunk_uncompressed_size: int):
+    # The slice has to be released before src_view's mmap can be closed.
+    with src_view[coffset:coffset + chunk_compressed_size] as compressed_chunk:
+        chunk = _inflate_chunk(compressed_chunk, chunk_uncompressed_size)
+    with stats.collector.phase("write"):
+        dest_map[uoffset:uoffset + chunk_uncompressed_size] = chunk
+
+
+def _decompress_mmap(source, dest_fd: int, workers: int, executor,
+                     expected_size: int):
+    main_header, chunk_headers = read_chunk_table(source)
+    _check_expected_size(main_header, expected_size)
+    data_offset = source.tell()
+
+    fsutil.preallocate(dest_fd, main_header.uncompressed_total)
+    os.ftruncate(dest_fd, main_header.uncompressed_total)
+    if main_header.uncompressed_total == 0:
+        return  # can't map an empty file, and there's nothing to write.
+
+    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as src_map, \
+            mmap.mmap(dest_fd, 0, access=mmap.ACCESS_WRITE) as dest_map:
+        if data_offset + main_header.compressed_total > len(src_map):
+            raise DecompressionError("truncated chunk")
+
+        with memoryview(src_map) as src_view:
+            def slots():
+                coffset, uoffset = data_offset, 0
+                for ch in chunk_headers:
+                    yield (
+                        src_view, coffset, ch.chunk_compressed_size,
+                        dest_map, uoffset, ch.chunk_uncompressed_size
+                    )
+                    coffset += ch.chunk_compressed_size
+                    uoffset += ch.chunk_uncompressed_size
+
+            for _ in _ordered_map(
+                _inflate_into, slots(), workers, executor=executor
+            ):
+                pass
+
+
+def decompress_file(source_path: str, dest_path: str, workers: int=1,
+                    executor=None, expected_size: int=None):
     """
+    Decompresses a compressed uasset file to dest_path.
+
+    If source_path is a regular file, it is memory mapped and each chunk is
+    inflated directly from the mapping into its slot in a memory mapped dest
+    file, which is sized and allocated up front from the header. Otherwise
+    this falls back to decompress().
+
+    :param source_path: path of the file to read compressed data from
+    :param dest_path:   path of the file to write uncompressed data to
+    :param workers:     number of threads to decompress chunks with
+    :param executor:    optional shared thread pool to decompress chunks on
+    :param expected_size: uncompressed size from elsewhere (e.g. the
+                          .uncompressed_size file), checked against the header
+    :raises FormatVersionError: raised if the signature/version magic is wrong
+    :raises InconsistencyError: raised if header values don't add up
+    :raises DecompressionError: rasied if there is any problem decompressing
+    """
+    with open(source_path, "rb") as source:
+        if not stat.S_ISREG(os.fstat(source.fileno()).st_mode):
+            with open(dest_path, "wb") as dest:
+                decompress(source, dest, workers, executor, expected_size)
+            return
 
-    compressed_total = 0
-    uncompressed_total = 0
+        dest_fd = os.open(dest_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            _decompress_mmap(
+                source, dest_fd, workers, executor, expected_size
+            )
+        finally:
+            os.close(dest_fd)
 
-    chunk_headers = []
-    chunks = []
+
+def verify(source, file_size: int=None, workers: int=1,
+           executor=None) -> UassetZMainHeader:
+    """
+    Checks a compressed uasset without writing anything: the headers, that
+    the chunks fit the file, and that every chunk inflates to its size.
+
+    :param source:      stream to read compressed data from
+    :param file_size:   size of the whole file, if known, to check against
+    :param workers:     number of threads to decompress chunks with
+    :param executor:    optional shared thread pool to decompress chunks on
+    :returns: the main header
+    :raises FormatVersionError: raised if the signature/version magic is wrong
+    :raises InconsistencyError: raised if header values don't add up
+    :raises DecompressionError: rasied if there is any problem decompressing
+    """
+    try:
+        main_header, chunk_headers = read_chunk_table(source)
+    except struct.error as exc:
+        raise DecompressionError("truncated header") from exc
+
+    if file_size is not None:
+        data_end = source.tell() + main_header.compressed_total
+        if data_end > file_size:
+            raise DecompressionError("truncated chunk")
+        if data_end < file_size:
+            raise InconsistencyError("trailing data after last chunk")
+
+    def compressed_chunks():
+        for chunk_compressed_size, chunk_uncompressed_size in chunk_headers:
+            compressed_chunk = source.read(chunk_compressed_size)
+            if len(compressed_chunk) != chunk_compressed_size:
+                raise DecompressionError(
+                    "truncated chunk"
+                )
+            yield compressed_chunk, chunk_uncompressed_size
+
+    for _ in _ordered_map(
+        _inflate_chunk, compressed_chunks(), workers, executor=executor
+    ):
+        pass
+    return main_header
+
+
+def verify_file(path: str, workers: int=1,
+                executor=None) -> UassetZMainHeader:
+    """Like verify(), for the file at path."""
+    with open(path, "rb") as source:
+        return verify(
+            source, os.fstat(source.fileno()).st_size, workers, executor
+        )
+
+
+def _read_chunks(source, chunk_size):
+    """Yields successive uncompressed chunks read from source"""
     while True:
         chunk = source.read(chunk_size)
         if len(chunk) == 0:
             break
+        yield chunk
+        if len(chunk) < chunk_size:
+            break
 
-        compressed_chunk = zlib.compress(chunk)
 
-        compressed_total += len(compressed_chunk)
-        uncompressed_total += len(chunk)
+def _count_chunks(source, chunk_size):
+    """
+    Works out how many chunks the rest of source will be split into,
+    without reading it. Returns None if source isn't seekable.
+    """
+    try:
+        if not source.seekable():
+            return None
+        pos = source.tell()
+        end = source.seek(0, io.SEEK_END)
+        source.seek(pos)
+    except (AttributeError, OSError):
+        return None
+    return -(-max(end - pos, 0) // chunk_size)
+
+
+def _seekable(stream) -> bool:
+    try:
+        return stream.seekable()
+    except (AttributeError, OSError):
+        return False
+
+
+def _deflate_chunk(chunk, level: int, strategy: int):
+    with stats.collector.phase("deflate"):
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy
+        )
+        compressed_chunk = compressor.compress(chunk) + compressor.flush()
+    stats.collector.count("chunks_deflated")
+    return len(chunk), compressed_chunk
+
+
+def _reference_chunks(reference, chunk_size):
+    """
+    Yields (compressed chunk, uncompressed size) for each chunk of reference,
+    then (None, None) forever. An unreadable reference, or one with another
+    chunk size, has no chunks.
+    """
+    try:
+        main_header, chunk_headers = read_chunk_table(reference)
+    except (UassetZError, struct.error):
+        chunk_headers = []
+    else:
+        if main_header.chunk_size != chunk_size:
+            chunk_headers = []
+
+    for chunk_header in chunk_headers:
+        compressed_chunk = reference.read(chunk_header.chunk_compressed_size)
+        if len(compressed_chunk) != chunk_header.chunk_compressed_size:
+            break
+        yield compressed_chunk, chunk_header.chunk_uncompressed_size
+    while True:
+        yield None, None
 
-        chunk_headers.append(UassetZChunkHeader(len(compressed_chunk), len(chunk)))
-        chunks.append(compressed_chunk)
 
-        if len(chunk) < chunk_size:
-            break
+def _reuse_or_deflate(chunk, level: int, strategy: int,
+                      ref_compressed_chunk, ref_uncompressed_size):
+    if ref_uncompressed_size == len(chunk):
+        try:
+            with stats.collector.phase("compare"):
+                same = zlib.decompress(ref_compressed_chunk) == chunk
+        except zlib.error:
+            same = False
+        if same:
+            stats.collector.count("chunks_reused")
+            return len(chunk), ref_compressed_chunk
+    return _deflate_chunk(chunk, level, strategy)
+
+
+def _write_chunks(source, dest, chunk_size, level, strategy, workers,
+                  executor, reference=None):
+    """
+    Compresses chunks from source and writes them to dest as they are made.
 
+    :returns: the list of chunk headers, in order
+    """
+    chunk_headers = []
+    if reference is None:
+        func = _deflate_chunk
+        arglists = (
+            (chunk, level, strategy)
+            for chunk in _read_chunks(source, chunk_size)
+        )
+    else:
+        func = _reuse_or_deflate
+        ref_chunks = _reference_chunks(reference, chunk_size)
+        arglists = (
+            (chunk, level, strategy, *next(ref_chunks))
+            for chunk in _read_chunks(source, chunk_size)
+        )
+    for chunk_len, compressed_chunk in _ordered_map(
+        func, arglists, workers, executor=executor
+    ):
+        chunk_headers.append(
+            UassetZChunkHeader(len(compressed_chunk), chunk_len)
+        )
+        dest.write(compressed_chunk)
+    return chunk_headers
+
+
+def _write_headers(dest, chunk_size, chunk_headers):
+    compressed_total = sum(ch.chunk_compressed_size for ch in chunk_headers)
+    uncompressed_total = sum(ch.chunk_uncompressed_size for ch in chunk_headers)
     mh = UassetZMainHeader(
         UNREAL_MAGIC, 0,
         chunk_size, compressed_total, uncompressed_total
@@ -175,5 +500,173 @@ def compress(source, dest, chunk_size=DEFAULT_CHUNK_SIZE):
     for ch in chunk_headers:
         write_chunk_header(dest, ch)
 
-    for chunk in chunks:
-        dest.write(chunk)
+
+def compress(source, dest, chunk_size=DEFAULT_CHUNK_SIZE,
+             level: int=zlib.Z_DEFAULT_COMPRESSION,
+             strategy: int=zlib.Z_DEFAULT_STRATEGY,
+             workers: int=1,
+             executor=None,
+             reference=None):
+    """
+    Compresses some data using "uasset.z" compression.
+
+    Only a couple of chunks are held in memory at a time. The main header and
+    chunk table come before the chunk data, so if both source and dest are
+    seekable, space for the table is reserved in dest and filled in once all
+    chunks are written. Otherwise, compressed chunks are spooled to a
+    temporary file and copied to dest afterwards.
+
+    Each chunk is an independent zlib stream, so with more than one worker
+    chunks are compressed in parallel. The output is the same whatever the
+    number of workers.
+
+    If reference (an earlier compressed version of the data) is given, each
+    chunk is first compared with the chunk at the same index in reference,
+    and if they match, reference's compressed chunk is copied over as is.
+    Inflating a chunk to compare it is much cheaper than deflating it, so a
+    small edit to a big file costs little more than the chunks it touches.
+
+    :param source:      stream to read uncompressed data from
+    :param dest:        stream to write compressed data to
+    :param chunk_size:  chunk size to use
+    :param level:       zlib compression level, 0-9 or -1 for zlib's default
+    :param strategy:    zlib compression strategy (zlib.Z_*)
+    :param workers:     number of threads to compress chunks with
+    :param executor:    optional shared thread pool to compress chunks on
+    :param reference:   optional stream of an earlier compressed version
+    :raises InconsistencyError: raised if source changes size while reading
+    """
+
+    n_chunks = _count_chunks(source, chunk_size)
+    if n_chunks is not None and _seekable(dest):
+        base = dest.tell()
+        dest.seek(base + MAIN_HEADER_SIZE + CHUNK_HEADER_SIZE * n_chunks)
+        chunk_headers = _write_chunks(
+            source, dest, chunk_size, level, strategy, workers, executor,
+            reference
+        )
+        if len(chunk_headers) != n_chunks:
+            raise InconsistencyError("source changed size during compression")
+        end = dest.tell()
+        dest.seek(base)
+        _write_headers(dest, chunk_size, chunk_headers)
+        dest.seek(end)
+        return
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+        chunk_headers = _write_chunks(
+            source, spool, chunk_size, level, strategy, workers, executor,
+            reference
+        )
+        _write_headers(dest, chunk_size, chunk_headers)
+        spool.seek(0)
+        shutil.copyfileobj(spool, dest, chunk_size)
+
+
+class UassetZReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over the uncompressed contents of a
+    compressed uasset.
+
+    Only the chunks covering the ranges actually read are decompressed.
+    Recently used chunks are kept in an LRU cache of at most cache_size
+    uncompressed bytes (but always at least one chunk).
+    The source stream must be seekable, and is not closed with the reader.
+
+    :param source:      stream to read compressed data from
+    :param cache_size:  upper bound of cached uncompressed data, in bytes
+    :raises FormatVersionError: raised if the signature/version magic is wrong
+    :raises InconsistencyError: raised if header values don't add up
+    """
+
+    def __init__(self, source, cache_size: int=READER_CACHE_SIZE):
+        super().__init__()
+        self.header, self._chunk_headers = read_chunk_table(source)
+        self._source = source
+
+        # Prefix sums of chunk sizes: chunk n starts at _coffsets[n] in the
+        # source and covers [_uoffsets[n], _uoffsets[n + 1]) of the output.
+        self._coffsets = [source.tell()]
+        self._uoffsets = [0]
+        for ch in self._chunk_headers:
+            self._coffsets.append(self._coffsets[-1] + ch.chunk_compressed_size)
+            self._uoffsets.append(self._uoffsets[-1] + ch.chunk_uncompressed_size)
+
+        self._pos = 0
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = 0
+        self._cache_size = cache_size
+
+    @property
+    def size(self) -> int:
+        return self.header.uncompressed_total
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self):
+        super().close()
+        self._cache.clear()
+        self._cache_bytes = 0
+
+    def tell(self) -> int:
+        self._checkClosed()
+        return self._pos
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError("invalid whence ({0})".format(whence))
+        if pos < 0:
+            raise ValueError("negative seek position {0}".format(pos))
+        self._pos = pos
+        return pos
+
+    def _chunk(self, index: int) -> bytes:
+        chunk = self._cache.get(index)
+        if chunk is not None:
+            self._cache.move_to_end(index)
+            return chunk
+
+        ch = self._chunk_headers[index]
+        self._source.seek(self._coffsets[index])
+        compressed_chunk = self._source.read(ch.chunk_compressed_size)
+        if len(compressed_chunk) != ch.chunk_compressed_size:
+            raise DecompressionError("truncated chunk")
+        chunk = _inflate_chunk(compressed_chunk, ch.chunk_uncompressed_size)
+
+        self._cache[index] = chunk
+        self._cache_bytes += len(chunk)
+        while self._cache_bytes > self._cache_size and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+        return chunk
+
+    def readinto(self, b) -> int:
+        self._checkClosed()
+        view = memoryview(b).cast("B")
+        n_chunks = len(self._chunk_headers)
+        n = 0
+        while n < len(view) and self._pos < self.size:
+            index = bisect.bisect_right(self._uoffsets, self._pos, 0, n_chunks) - 1
+            chunk = self._chunk(index)
+            start = self._pos - self._uoffsets[index]
+            count = min(len(view) - n, len(chunk) - start)
+            view[n:n + count] = chunk[start:start + count]
+            n += count
+            self._pos += count
+        return n
+
+    def readall(self) -> bytes:
+        buf = bytearray(max(self.size - self._pos, 0))
+        n = self.readinto(buf)
+        return bytes(buf[:n])
@@ -1,5 +1,9 @@
+import os
 import sys
+import stat
+import json
 
+import zlib
 import argparse
 
 from . import uassetz
@@ -7,30 +11,89 @@ from . import uassetz
 COMPRESS_ALIASES = {"compress", "c"}
 DECOMPRESS_ALIASES = {"decompress", "x"}
 INFORMATION_ALIASES = {"information", "t", "?"}
+VERIFY_ALIASES = {"verify", "v"}
 
-MODE_CHOICES = COMPRESS_ALIASES | DECOMPRESS_ALIASES | INFORMATION_ALIASES
+MODE_CHOICES = COMPRESS_ALIASES | DECOMPRESS_ALIASES | INFORMATION_ALIASES \
+    | VERIFY_ALIASES
+
+STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED
+}
 
 
 def uassetztool(args):
     if args.mode not in MODE_CHOICES:
         return 1
     elif args.mode in COMPRESS_ALIASES:
-        uassetz.compress(args.i, args.o)
+        uassetz.compress(
+            args.i, args.o,
+            level=args.level,
+            strategy=STRATEGIES[args.strategy],
+            workers=args.workers,
+            reference=args.reference
+        )
     elif args.mode in DECOMPRESS_ALIASES:
-        uassetz.decompress(args.i, args.o)
+        uassetz.decompress(args.i, args.o, workers=args.workers)
     elif args.mode in INFORMATION_ALIASES:
         h = uassetz.read_main_header(args.i)
         args.o.write(str(h).encode("utf8"))
         args.o.write(b"\n")
+    elif args.mode in VERIFY_ALIASES:
+        report = {"path": args.i.name, "ok": True, "error": None}
+        try:
+            try:
+                st = os.fstat(args.i.fileno())
+                file_size = st.st_size if stat.S_ISREG(st.st_mode) else None
+            except (AttributeError, OSError):
+                file_size = None
+            h = uassetz.verify(args.i, file_size, workers=args.workers)
+            report["uncompressed_total"] = h.uncompressed_total
+        except uassetz.UassetZError as err:
+            report["ok"] = False
+            report["error"] = "{0}: {1}".format(type(err).__name__, err)
+        args.o.write(json.dumps(report).encode("utf8"))
+        args.o.write(b"\n")
+        return 0 if report["ok"] else 1
     return 0
 
 
 def tool_argparse(parser):
-    parser.add_argument("mode", action="store", choices=MODE_CHOICES)
-    parser.add_argument("i", action="store", nargs="?", type=argparse.FileType("rb"), default=sys.stdin.buffer)
-    parser.add_argument("o", action="store", nargs="?", type=argparse.FileType("rb"), default=sys.stdout.buffer)
+    def add_io_arguments(modep):
+        modep.add_argument("i", action="store", nargs="?", type=argparse.FileType("rb"), default=sys.stdin.buffer)
+        modep.add_argument("o", action="store", nargs="?", type=argparse.FileType("wb"), default=sys.stdout.buffer)
+
     parser.set_defaults(func=uassetztool)
 
+    # Each mode is a subparser so options can follow the mode name.
+    spo = parser.add_subparsers(dest="mode")
+    spo.required = True
+
+    compp = spo.add_parser("compress", aliases=["c"])
+    add_io_arguments(compp)
+    compp.add_argument("-l", "--level", dest="level", action="store", type=int, choices=range(-1, 10), default=zlib.Z_DEFAULT_COMPRESSION)
+    compp.add_argument("-s", "--strategy", dest="strategy", action="store", choices=STRATEGIES.keys(), default="default")
+    compp.add_argument("-j", "--jobs", dest="workers", action="store", type=int, default=1)
+    compp.add_argument("-r", "--reference", dest="reference", action="store", type=argparse.FileType("rb"), default=None)
+    compp.set_defaults(mode="compress")
+
+    decp = spo.add_parser("decompress", aliases=["x"])
+    add_io_arguments(decp)
+    decp.add_argument("-j", "--jobs", dest="workers", action="store", type=int, default=1)
+    decp.set_defaults(mode="decompress")
+
+    infp = spo.add_parser("information", aliases=["t", "?"])
+    add_io_arguments(infp)
+    infp.set_defaults(mode="information")
+
+    verp = spo.add_parser("verify", aliases=["v"])
+    add_io_arguments(verp)
+    verp.add_argument("-j", "--jobs", dest="workers", action="store", type=int, default=1)
+    verp.set_defaults(mode="verify")
+
 
 def main():
     parser = argparse.ArgumentParser()
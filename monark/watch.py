@@ -0,0 +1,232 @@
+"""
+Watching the workshop storage dir for updated mods.
+
+On Linux, changes are picked up with inotify (through ctypes), with a watch
+on every directory under the storage dir. Elsewhere, or if inotify can't be
+set up, each mod dir is polled for a cheap signature (file count, total
+size, newest mtime).
+
+Either way, a mod is only reported once it has "settled": nothing in it has
+changed for a while, and Steam isn't still downloading it.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from os.path import join, relpath, dirname, basename, isdir
+
+from typing import Set, Callable
+
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _modid_of(root: str, path: str):
+    rel = relpath(path, root)
+    if rel == "." or rel.startswith(".."):
+        return None
+    modid = rel.split(os.sep, 1)[0]
+    return modid if modid.isnumeric() else None
+
+
+def _list_mods(root: str) -> Set[str]:
+    if not isdir(root):
+        return set()
+    return {modid for modid in os.listdir(root) if modid.isnumeric()}
+
+
+class InotifyWatcher:
+    """
+    :raises OSError: if inotify isn't available
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        libc_name = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.wds = {}
+        self.add_tree(root)
+
+    def close(self):
+        os.close(self.fd)
+
+    def add_watch(self, path: str):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return  # gone already.
+            raise OSError(err, os.strerror(err), path)
+        self.wds[wd] = path
+
+    def add_tree(self, path: str):
+        self.add_watch(path)
+        for dirpath, dirnames, filenames in os.walk(path):
+            for dirname_ in dirnames:
+                self.add_watch(join(dirpath, dirname_))
+
+    def changes(self, timeout: float) -> Set[str]:
+        """Waits up to timeout seconds, returns the mods that changed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+
+        modids = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 0x10000)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, namelen = _EVENT.unpack_from(buf, offset)
+                offset += _EVENT.size
+                name = buf[offset:offset + namelen].rstrip(b"\x00")
+                offset += namelen
+
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost; assume everything changed.
+                    modids |= _list_mods(self.root)
+                    continue
+                if mask & IN_IGNORED:
+                    self.wds.pop(wd, None)
+                    continue
+                dirpath = self.wds.get(wd)
+                if dirpath is None:
+                    continue
+                path = join(dirpath, os.fsdecode(name)) if name else dirpath
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                modid = _modid_of(self.root, path)
+                if modid is not None:
+                    modids.add(modid)
+        return modids
+
+
+class PollWatcher:
+    def __init__(self, root: str, interval: float=10.0):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def close(self):
+        pass
+
+    def mod_signature(self, path: str):
+        count = size = newest = 0
+        stack = [path]
+        while len(stack) > 0:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for ent in it:
+                    st = ent.stat(follow_symlinks=False)
+                    newest = max(newest, st.st_mtime_ns)
+                    if ent.is_dir(follow_symlinks=False):
+                        stack.append(ent.path)
+                    else:
+                        count += 1
+                        size += st.st_size
+        return count, size, newest
+
+    def take_snapshot(self) -> dict:
+        return {
+            modid: self.mod_signature(join(self.root, modid))
+            for modid in _list_mods(self.root)
+        }
+
+    def changes(self, timeout: float) -> Set[str]:
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.take_snapshot()
+        modids = {
+            modid for modid in snapshot.keys() | self.snapshot.keys()
+            if snapshot.get(modid) != self.snapshot.get(modid)
+        }
+        self.snapshot = snapshot
+        return modids
+
+
+def downloads_dir(mod_storage_dir: str) -> str:
+    """
+    Where Steam keeps workshop items while they download:
+    steamapps/workshop/content/<appid> -> steamapps/workshop/downloads/<appid>
+    """
+    return join(
+        dirname(dirname(os.path.normpath(mod_storage_dir))),
+        "downloads",
+        basename(os.path.normpath(mod_storage_dir))
+    )
+
+
+def open_watcher(mod_storage_dir: str, poll: bool=False,
+                 interval: float=10.0):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(mod_storage_dir)
+        except OSError as err:
+            print("inotify unavailable ({0}), polling instead.".format(err),
+                  file=sys.stderr)
+    return PollWatcher(mod_storage_dir, interval)
+
+
+def watch(watcher, mod_storage_dir: str, on_settled: Callable[[str], None],
+          settle: float=30.0):
+    """
+    Calls on_settled(modid) for each mod that changes, once it has settled:
+    no changes for settle seconds, and nothing left in Steam's downloads dir.
+    Runs until interrupted.
+    """
+    downloading = downloads_dir(mod_storage_dir)
+    pending = {}
+    while True:
+        now = time.monotonic()
+        timeout = settle
+        if len(pending) > 0:
+            timeout = max(0.0, min(pending.values()) + settle - now)
+
+        for modid in watcher.changes(timeout):
+            pending[modid] = time.monotonic()
+
+        now = time.monotonic()
+        for modid, last in sorted(pending.items()):
+            if now - last < settle:
+                continue
+            if isdir(join(downloading, modid)):
+                pending[modid] = now    # still downloading, check again later.
+                continue
+            del pending[modid]
+            on_settled(modid)
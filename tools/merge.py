@@ -3,9 +3,13 @@ import argparse
 
 import os
 import re
+import sys
 import configparser
 import difflib
 import shutil
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
 
 def newlines(n):
     while n > 0:
@@ -60,57 +64,182 @@ def update_cfg_stream(settings, source):
         yield "\n"
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("-c", "--confpath", dest="conf_path", action="store", default="../ShooterGame/Saved/Config/LinuxServer/")
-parser.add_argument("-m", "--mergepath", dest="merge_path", action="store", default="./")
-parser.add_argument("-i", "--interactive", dest="interactive", action="store_true", default=False)
-parser.add_argument("-d", "--dry", dest="dry", action="store_true", default=False)
+def read_merge_settings(path):
+    mrgcfg = configparser.ConfigParser()
+    mrgcfg.optionxform = lambda option: option
 
-args = parser.parse_args()
+    with open(path, "rt") as source:
+        mrgcfg.read_file(source)
 
+    # Plain dicts, so they can be shared between threads.
+    return {section: dict(mrgcfg[section]) for section in mrgcfg.sections()}
+
+
+def atomic_write(path, lines):
+    """
+    Writes lines to path via a synced temporary file, so the file is always
+    either the old or the new version, even across a crash. The old version
+    is kept as path + ".orig".
+    """
+    with open(path + ".atom", "wt") as newfile:
+        newfile.writelines(lines)
+        newfile.flush()
+        os.fsync(newfile.fileno())
+
+    if os.path.exists(path):
+        if os.path.exists(path + ".orig"):
+            os.unlink(path + ".orig")
+        os.link(path, path + ".orig")
+    os.replace(path + ".atom", path)
+
+    dirfd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+
+
+def merge_target(merges, conf_path, dry):
+    """
+    Applies every merge file to one target config directory.
+
+    :returns: list of (conf, status, lines changed, error)
+    """
+    if not os.path.isdir(conf_path):
+        return [(conf, "failed", 0, "no such directory") for conf in sorted(merges)]
+
+    results = []
+    for conf, (merge_lines, settings) in sorted(merges.items()):
+        path = os.path.join(conf_path, conf)
+        try:
+            if not os.path.exists(path):
+                if not dry:
+                    atomic_write(path, merge_lines)
+                results.append((conf, "copied", len(merge_lines), None))
+                continue
 
-for conf in os.listdir(args.merge_path):
-    if not conf.endswith(".ini"):
-        continue
+            with open(path, "rt") as source:
+                oldcfg = source.readlines()
+            newcfg = list(update_cfg_stream(settings, oldcfg))
+            if newcfg == oldcfg:
+                results.append((conf, "unchanged", 0, None))
+                continue
 
-    if not os.path.exists(args.conf_path + conf):
-        print("=== copying", conf)
-        src, dest = args.merge_path + conf, args.conf_path + conf
-        if args.dry:
+            changed = sum(
+                1 for line in difflib.unified_diff(oldcfg, newcfg, n=0)
+                if line[:1] in "+-" and line[:3] not in ("+++", "---")
+            )
+            if not dry:
+                atomic_write(path, newcfg)
+            results.append((conf, "merged", changed, None))
+        except OSError as err:
+            results.append((conf, "failed", 0, err))
+    return results
+
+
+def batch(args):
+    """
+    Merges args.merge_path into every directory in args.batch, in parallel,
+    and prints one summary for the lot.
+    """
+    merges = {}
+    for conf in os.listdir(args.merge_path):
+        if not conf.endswith(".ini"):
             continue
+        path = os.path.join(args.merge_path, conf)
+        with open(path, "rt") as source:
+            merge_lines = source.readlines()
+        merges[conf] = (merge_lines, read_merge_settings(path))
+
+    with ThreadPoolExecutor(args.jobs) as pool:
+        all_results = list(pool.map(
+            lambda conf_path: merge_target(merges, conf_path, args.dry),
+            args.batch
+        ))
+
+    totals = collections.OrderedDict(
+        (conf, collections.Counter()) for conf in sorted(merges)
+    )
+    lines = collections.Counter()
+    failures = []
+    for conf_path, results in zip(args.batch, all_results):
+        for conf, status, changed, err in results:
+            totals[conf][status] += 1
+            lines[conf] += changed
+            if err is not None:
+                failures.append((os.path.join(conf_path, conf), err))
+
+    print("=== {0}summary: {1} targets, {2} files".format(
+        "dry run " if args.dry else "", len(args.batch), len(merges)
+    ))
+    for conf, counts in totals.items():
+        print("  {0}: {1} ({2} lines changed)".format(
+            conf,
+            ", ".join("{0} {1}".format(n, status) for status, n in sorted(counts.items())),
+            lines[conf]
+        ))
+    for path, err in failures:
+        print("  failed {0}: {1}".format(path, err))
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--confpath", dest="conf_path", action="store", default="../ShooterGame/Saved/Config/LinuxServer/")
+    parser.add_argument("-m", "--mergepath", dest="merge_path", action="store", default="./")
+    parser.add_argument("-i", "--interactive", dest="interactive", action="store_true", default=False)
+    parser.add_argument("-d", "--dry", dest="dry", action="store_true", default=False)
+    parser.add_argument("-b", "--batch", dest="batch", action="store", nargs="+", default=None)
+    parser.add_argument("-j", "--jobs", dest="jobs", action="store", type=int, default=8)
+
+    args = parser.parse_args()
+
+    if args.batch is not None:
         if args.interactive:
-            resp = input("copy '%s' to '%s'? [y/n] " % (src, dest)).lower()
-            if not resp.startswith("y"):
+            parser.error("--interactive can't be used with --batch")
+        return batch(args)
+
+
+    for conf in os.listdir(args.merge_path):
+        if not conf.endswith(".ini"):
+            continue
+
+        if not os.path.exists(args.conf_path + conf):
+            print("=== copying", conf)
+            src, dest = args.merge_path + conf, args.conf_path + conf
+            if args.dry:
                 continue
-        shutil.copy(src, dest)
-        continue
+            if args.interactive:
+                resp = input("copy '%s' to '%s'? [y/n] " % (src, dest)).lower()
+                if not resp.startswith("y"):
+                    continue
+            shutil.copy(src, dest)
+            continue
 
-    print("=== merging", conf)
-    mrgcfg = configparser.ConfigParser()
-    mrgcfg.optionxform = lambda option: option
+        print("=== merging", conf)
+        mrgcfg = read_merge_settings(args.merge_path + conf)
 
-    with open(args.merge_path + conf, "rt") as source:
-        mrgcfg.read_file(source)
+        with open(args.conf_path + conf, "rt") as source:
+            oldcfg = source.readlines()
+
+        newcfg = list(update_cfg_stream(mrgcfg, oldcfg))
 
-    with open(args.conf_path + conf, "rt") as source:
-        oldcfg = source.readlines()
-
-    mrgcfg = dict(mrgcfg)
-    del mrgcfg["DEFAULT"]
-    newcfg = list(update_cfg_stream(mrgcfg, oldcfg))
-
-    print("=== diff")
-    print("".join(difflib.unified_diff(oldcfg, newcfg)))
-    print("=== diff end")
-    if args.dry:
-        continue
-    if args.interactive:
-        resp = input("update '%s'? [y/n]" % (conf)).lower()
-        if not resp.startswith("y"):
+        print("=== diff")
+        print("".join(difflib.unified_diff(oldcfg, newcfg)))
+        print("=== diff end")
+        if args.dry:
             continue
+        if args.interactive:
+            resp = input("update '%s'? [y/n]" % (conf)).lower()
+            if not resp.startswith("y"):
+                continue
+
+        with open(args.conf_path + conf + ".atom", "wt") as newfile:
+            newfile.writelines(newcfg)
+
+        os.rename(args.conf_path + conf, args.conf_path + conf + ".orig")
+        os.rename(args.conf_path + conf + ".atom", args.conf_path + conf)
 
-    with open(args.conf_path + conf + ".atom", "wt") as newfile:
-        newfile.writelines(newcfg)
 
-    os.rename(args.conf_path + conf, args.conf_path + conf + ".orig")
-    os.rename(args.conf_path + conf + ".atom", args.conf_path + conf)
+if __name__ == "__main__":
+    sys.exit(main())